@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
-from llama_cpp import Llama
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task4"))
+from sampling_sweep import parameter_grid, render_chat_prompt, run_sweep
+from structured_output import RECEPTIONIST_SCHEMA, format_structured, grammar_for, parse_structured, structured_prompt
+from transcript_store import TranscriptStore, model_key
 
 MODEL_PATH = "./models/mistral-7b-instruct-v0.1.Q4_K_M.gguf"
 
 def main():
-    llm = Llama(
+    # Imported here so llama_cpp only loads once we are about to use the model
+    from context_shift import ShiftingLlama
+
+    # Slides the KV cache when a long conversation reaches n_ctx
+    llm = ShiftingLlama(
         model_path=MODEL_PATH,
         n_ctx=2048,
         n_threads=8,
@@ -24,7 +35,9 @@ def main():
 
     print("🛍️ Shop Receptionist (Mistral-7B-Instruct)")
     print("Type 'clear' to reset, 'quit' to exit.")
-    print("Type 'params' to adjust generation parameters.\n")
+    print("Type 'params' to adjust generation parameters.")
+    print("Type 'sweep' to compare sampling settings on one question.")
+    print("Type 'json' to toggle structured (JSON) replies.\n")
 
     instruction = (
         "You are a professional and helpful shop receptionist in a clothing & accessories store. "
@@ -38,8 +51,17 @@ def main():
         "Never talk about your own personal experiences, only store-related information."
     )
 
+    # Never shift the system prompt out of the context window
+    llm.n_keep = len(llm.tokenize(instruction.encode("utf-8"))) + 8
+
     # Message history for llama-cpp chat API
     messages = [{"role": "system", "content": instruction}]
+    # Structured mode: replies are decoded against RECEPTIONIST_SCHEMA's grammar
+    structured = False
+    # Transcripts and latency go to the shared store from a background thread
+    store = TranscriptStore()
+    model_name = model_key(MODEL_PATH)
+    session_id = store.start_session("task1", model_name, system_prompt=instruction)
 
     def show_params():
         print("\n📊 Current generated parameter:")
@@ -69,6 +91,38 @@ def main():
                 print("❌ Unknown parameter, available parameters:", list(generation_params.keys()))
         show_params()
 
+    def parse_values(label, default, cast=float):
+        raw = input(f"{label} values, comma separated (Enter = {default}): ").strip()
+        if not raw:
+            return default
+        try:
+            return [cast(v) for v in raw.split(',') if v.strip()]
+        except ValueError:
+            print("❌ Invalid value, using the default")
+            return default
+
+    def sweep_params():
+        question = input("Question to sweep: ").strip()
+        if not question:
+            return
+        configs = parameter_grid(
+            temperature=parse_values("temperature", [0.2, generation_params["temperature"], 1.0]),
+            top_p=parse_values("top_p", [generation_params["top_p"]]),
+            top_k=parse_values("top_k", [int(generation_params["top_k"])], int),
+            repeat_penalty=parse_values("repeat_penalty", [generation_params["repeat_penalty"]]),
+            seed=parse_values("seed", [0, 1], int),
+        )
+        # The question is prefilled once; each config decodes from that state
+        prompt, stop, added_special = render_chat_prompt(llm, messages + [{"role": "user", "content": question}])
+        tokens = llm.tokenize(prompt.encode("utf-8"), add_bos=not added_special, special=True)
+        print(f"\n🔬 Running {len(configs)} configs from one prefill...")
+        result = run_sweep(
+            llm, tokens, configs,
+            max_tokens=int(generation_params["max_tokens"]),
+            stop=stop + list(generation_params["stop"]),
+        )
+        print(result.table() + "\n")
+
     while True:
         user = input("Customer: ").strip()
         if not user:
@@ -77,26 +131,53 @@ def main():
             break
         if user.lower() in {"clear", "reset"}:
             messages = [{"role": "system", "content": instruction}]
+            store.end_session(session_id)
+            session_id = store.start_session("task1", model_name, system_prompt=instruction)
             print("Receptionist: I've reset our conversation. How can I help you today?\n")
             continue
         if user.lower() == "params":
             adjust_params()
             continue
+        if user.lower() == "sweep":
+            sweep_params()
+            continue
+        if user.lower() == "json":
+            structured = not structured
+            print(f"Receptionist: Structured replies {'on' if structured else 'off'}.\n")
+            continue
 
         messages.append({"role": "user", "content": user})
+        t0 = time.time()
+        data = None
         try:
-            response = llm.create_chat_completion(
-                messages=messages, 
-                **generation_params  # 使用参数字典
-            )
-            reply = response["choices"][0]["message"]["content"].strip()
+            if structured:
+                request = messages[:-1] + [{"role": "user", "content": structured_prompt(user, RECEPTIONIST_SCHEMA)}]
+                response = llm.create_chat_completion(
+                    messages=request,
+                    grammar=grammar_for(RECEPTIONIST_SCHEMA),
+                    **dict(generation_params, stop=[])  # a stop word inside a JSON string would cut it
+                )
+                data = parse_structured(response["choices"][0]["message"]["content"], RECEPTIONIST_SCHEMA)
+                reply = format_structured(data)
+            else:
+                response = llm.create_chat_completion(
+                    messages=messages, 
+                    **generation_params  # 使用参数字典
+                )
+                reply = response["choices"][0]["message"]["content"].strip()
         except Exception as e:
             reply = "Sorry, something went wrong. Please try again."
 
         if not reply:
             reply = "Sorry, could you rephrase that? I can help with sizes, prices, availability and returns."
         print(f"Receptionist: {reply}\n")
-        messages.append({"role": "assistant", "content": reply})
+        # Keep plain sentences in the history so free-text mode is not nudged into JSON
+        messages.append({"role": "assistant", "content": data["reply"] if data else reply})
+        store.log_turn(session_id, user, reply, model=model_name, latency=time.time() - t0,
+                       params=dict(generation_params), structured=data)
+
+    store.end_session(session_id)
+    store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
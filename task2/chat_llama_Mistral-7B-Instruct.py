@@ -1,29 +1,17 @@
-import os, requests, time, psutil, argparse
-from rich.console import Console
-from rich.prompt import Prompt
-from llama_cpp import Llama
-
-console = Console()
-
-# ---------- Step 1: 下载模型 ----------
-def download_model(url, save_path):
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    if not os.path.exists(save_path):
-        console.print(f"[yellow]Downloading model from {url} ... (~2GB, may take a while)")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(save_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        console.print(f"[green]Model downloaded and saved to {save_path}")
-    else:
-        console.print(f"[cyan]Model already exists at {save_path}")
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task4"))
+from model_files import MODELS, download_model
+from transcript_store import DEFAULT_DB, TranscriptStore, model_key
+
+# rich / psutil / llama_cpp are imported where first needed so that
+# --help returns immediately; console is created at the start of main().
+console = None
 
 # 默认模型（Mistral-7B-Instruct Q4_K_M）
-MODEL_URL = "https://huggingface.co/TheBloke/Mistral-7B-Instruct-v0.2-GGUF/resolve/main/mistral-7b-instruct-v0.2.Q4_K_M.gguf"
-MODEL_PATH = "./models/mistral-7b-instruct.Q4_K_M.gguf"
+MODEL_URL, MODEL_PATH = MODELS["Mistral-7B-Instruct"]
 
-# ---------- Step 2: 主函数 ----------
+# ---------- 主函数 ----------
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--model", type=str, default=MODEL_PATH, help="Path to .gguf model")
@@ -34,16 +22,26 @@ def main():
     ap.add_argument("--temp", type=float, default=0.7)
     ap.add_argument("--top-p", type=float, default=0.9)
     ap.add_argument("--system", type=str, default="You are a helpful assistant.")
-    ap.add_argument("--log", type=str, default="runs/session_llama.txt")
+    ap.add_argument("--log", type=str, default="runs/session_llama.txt", help="Text transcript written by /save")
+    ap.add_argument("--db", type=str, default=DEFAULT_DB, help="Transcript/metrics store shared by all front ends")
     args = ap.parse_args()
 
+    global console
+    from rich.console import Console
+    from rich.prompt import Prompt
+
+    console = Console()
+
     # 下载模型（如果不存在）
-    download_model(MODEL_URL, args.model)
+    download_model(MODEL_URL, args.model, console)
 
     os.makedirs("runs", exist_ok=True)
 
     # 初始化模型
     console.print(f"[blue]Loading model from {args.model} ...")
+    import psutil
+    from llama_cpp import Llama
+
     llm = Llama(
         model_path=args.model,
         n_ctx=args.ctx,
@@ -56,7 +54,11 @@ def main():
     console.print("[dim]Commands: /reset /exit /save\n")
 
     messages = [{"role":"system","content":args.system}]
-    with open(args.log, "w", encoding="utf-8") as f:
+    # 对话记录由后台线程批量写入 SQLite，不阻塞生成
+    store = TranscriptStore(args.db)
+    model_name = model_key(args.model)
+    session_id = store.start_session("task2", model_name, system_prompt=args.system)
+    try:
         while True:
             user = Prompt.ask("[bold green]You")
             if user.strip() == "/exit":
@@ -64,10 +66,13 @@ def main():
                 break
             if user.strip() == "/reset":
                 messages = [{"role":"system","content":args.system}]
+                store.end_session(session_id)
+                session_id = store.start_session("task2", model_name, system_prompt=args.system)
                 console.print("[yellow]Session reset.")
                 continue
             if user.strip() == "/save":
-                console.print(f"[cyan]Saved to {args.log}")
+                n = store.export_text(session_id, args.log)
+                console.print(f"[cyan]Saved {n} turns to {args.log}")
                 continue
 
             messages.append({"role":"user","content":user})
@@ -88,8 +93,10 @@ def main():
             console.print(f"[dim]Latency: {dt:.2f}s | RAM: {mem:.1f} MB[/]\n")
 
             messages.append({"role":"assistant","content":reply})
-            f.write(f"USER: {user}\nASSISTANT: {reply}\n-- {dt:.2f}s, {mem:.1f}MB --\n\n")
-            f.flush()
+            store.log_turn(session_id, user, reply, model=model_name, latency=dt, rss_mb=mem)
+    finally:
+        store.end_session(session_id)
+        store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,267 @@
+import os, sys, time, json, argparse, queue, multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task4"))
+from model_files import MODELS, download_model
+from transcript_store import DEFAULT_DB, TranscriptStore, model_key
+
+# rich is imported in main(): spawned workers re-import this module and never
+# draw anything, and --help / --list-models should not pay for it either.
+console = None
+
+# ---------- CPU 绑定 ----------
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_sets(spec, n_models):
+    """'0-3;4-7' -> [[0,1,2,3],[4,5,6,7]]；为空时把可用 CPU 平均切成 n_models 份。"""
+    if spec:
+        sets = []
+        for group in spec.split(";"):
+            cpus = []
+            for part in group.split(","):
+                part = part.strip()
+                if "-" in part:
+                    lo, hi = part.split("-")
+                    cpus.extend(range(int(lo), int(hi) + 1))
+                elif part:
+                    cpus.append(int(part))
+            sets.append(cpus)
+        if len(sets) != n_models:
+            raise ValueError(f"--cpus gives {len(sets)} sets for {n_models} models")
+        return sets
+    cpus = available_cpus()
+    per_model = max(len(cpus) // n_models, 1)
+    return [cpus[i * per_model:(i + 1) * per_model] or cpus[-1:] for i in range(n_models)]
+
+
+# ---------- 工作进程：每个模型一个进程 ----------
+def model_worker(name, model_path, cpus, args, requests_q, events_q):
+    import psutil
+    from llama_cpp import Llama
+
+    pinned = False
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        pinned = True
+    proc = psutil.Process()
+    try:
+        llm = Llama(
+            model_path=model_path,
+            n_ctx=args.ctx,
+            n_threads=len(cpus),
+            n_gpu_layers=args.n_gpu_layers,
+            verbose=False,
+        )
+    except Exception as e:
+        events_q.put(("error", name, str(e)))
+        return
+    events_q.put(("ready", name, {"cpus": cpus, "pinned": pinned, "rss_mb": proc.memory_info().rss / (1024**2)}))
+
+    messages = [{"role": "system", "content": args.system}]
+    while True:
+        item = requests_q.get()
+        if item is None:
+            break
+        if item == "/reset":
+            messages = [{"role": "system", "content": args.system}]
+            continue
+        messages.append({"role": "user", "content": item})
+        t0 = time.perf_counter()
+        ttft, n_tokens, parts = None, 0, []
+        try:
+            stream = llm.create_chat_completion(
+                messages=messages,
+                temperature=args.temp,
+                top_p=args.top_p,
+                max_tokens=args.max_tokens,
+                stream=True,
+            )
+            for chunk in stream:
+                piece = chunk["choices"][0]["delta"].get("content")
+                if not piece:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                n_tokens += 1
+                parts.append(piece)
+                events_q.put(("token", name, piece))
+        except Exception as e:
+            parts.append(f"\n(模型调用异常: {e})")
+        total = time.perf_counter() - t0
+        reply = "".join(parts)
+        messages.append({"role": "assistant", "content": reply})
+        decode_time = total - (ttft or 0.0)
+        events_q.put((
+            "done",
+            name,
+            {
+                "reply": reply,
+                "ttft": ttft,
+                "latency": total,
+                "tokens": n_tokens,
+                "tok_s": (n_tokens - 1) / decode_time if n_tokens > 1 and decode_time > 0 else 0.0,
+                "rss_mb": proc.memory_info().rss / (1024**2),
+            },
+        ))
+
+
+def next_event(events_q, procs, pending, poll=0.5):
+    """下一个 worker 事件；等待中的 worker 进程退出（如 OOM 被杀）时返回 ("exit", name, exitcode)。"""
+    while True:
+        try:
+            return events_q.get(timeout=poll)
+        except queue.Empty:
+            for name in pending:
+                if not procs[name].is_alive():
+                    return ("exit", name, procs[name].exitcode)
+
+
+def render(names, texts, stats):
+    from rich.columns import Columns
+    from rich.panel import Panel
+
+    panels = []
+    for name in names:
+        st = stats.get(name)
+        if st is None:
+            subtitle = "[dim]generating..."
+        else:
+            ttft = f"{st['ttft']:.2f}s" if st["ttft"] is not None else "-"
+            subtitle = f"TTFT {ttft} | {st['tok_s']:.1f} tok/s | {st['latency']:.2f}s | RSS {st['rss_mb']:.0f} MB"
+        panels.append(Panel(texts.get(name, ""), title=f"[bold]{name}", subtitle=subtitle, expand=True))
+    return Columns(panels, equal=True, expand=True)
+
+
+# ---------- 主函数 ----------
+def main():
+    ap = argparse.ArgumentParser(description="Send each prompt to several models at once and compare them side by side.")
+    ap.add_argument("--models", type=str, default=",".join(MODELS), help="Comma-separated names from: " + ", ".join(MODELS))
+    ap.add_argument("--cpus", type=str, default="", help="CPU sets per model, e.g. '0-3;4-7' (default: split evenly)")
+    ap.add_argument("--ctx", type=int, default=2048)
+    ap.add_argument("--n-gpu-layers", type=int, default=0)
+    ap.add_argument("--max-tokens", type=int, default=512)
+    ap.add_argument("--temp", type=float, default=0.7)
+    ap.add_argument("--top-p", type=float, default=0.9)
+    ap.add_argument("--system", type=str, default="You are a helpful assistant.")
+    ap.add_argument("--log", type=str, default="runs/compare_models.jsonl")
+    ap.add_argument("--db", type=str, default=DEFAULT_DB, help="Transcript/metrics store shared by all front ends")
+    ap.add_argument("--list-models", action="store_true", help="Print the known models and exit")
+    args = ap.parse_args()
+
+    if args.list_models:
+        for name, (_, path) in MODELS.items():
+            print(f"{name:<22} {path} ({'ok' if os.path.exists(path) else 'not downloaded'})")
+        return
+
+    global console
+    from rich.console import Console
+    from rich.live import Live
+    from rich.prompt import Prompt
+
+    console = Console()
+
+    names = [n.strip() for n in args.models.split(",") if n.strip()]
+    unknown = [n for n in names if n not in MODELS]
+    if unknown:
+        ap.error(f"unknown model(s): {', '.join(unknown)}")
+    for name in names:
+        download_model(*MODELS[name], console)
+    cpu_sets = parse_cpu_sets(args.cpus, len(names))
+
+    os.makedirs(os.path.dirname(args.log) or ".", exist_ok=True)
+    ctx = mp.get_context("spawn")
+    events_q = ctx.Queue()
+    request_qs = {}
+    procs = {}
+    for name, cpus in zip(names, cpu_sets):
+        request_qs[name] = ctx.Queue()
+        p = ctx.Process(target=model_worker, args=(name, MODELS[name][1], cpus, args, request_qs[name], events_q), daemon=True)
+        p.start()
+        procs[name] = p
+
+    console.print(f"[blue]Loading {len(names)} model(s) in parallel ...")
+    ready = set()
+    while len(ready) < len(names):
+        kind, name, payload = next_event(events_q, procs, [n for n in names if n not in ready])
+        if kind in ("error", "exit"):
+            reason = payload if kind == "error" else f"worker exited with code {payload} (out of memory?)"
+            console.print(f"[red]{name} failed to load: {reason}")
+            for q in request_qs.values():
+                q.put(None)
+            return
+        ready.add(name)
+        pin = "pinned" if payload["pinned"] else "not pinned (no sched_setaffinity)"
+        console.print(f"[green]{name} ready on CPUs {payload['cpus']} ({pin}), RSS {payload['rss_mb']:.0f} MB")
+
+    console.rule("[bold cyan]Model comparison (llama-cpp-python)")
+    console.print("[dim]Commands: /reset /exit\n")
+
+    store = TranscriptStore(args.db)
+    start_sessions = lambda: {n: store.start_session("compare", model_key(MODELS[n][1]), system_prompt=args.system) for n in names}
+    sessions = start_sessions()
+    with open(args.log, "a", encoding="utf-8") as f:
+        while True:
+            user = Prompt.ask("[bold green]You")
+            if user.strip() == "/exit":
+                console.print("[yellow]Bye!")
+                break
+            if user.strip() == "/reset":
+                for q in request_qs.values():
+                    q.put("/reset")
+                for sid in sessions.values():
+                    store.end_session(sid)
+                sessions = start_sessions()
+                console.print("[yellow]Session reset.")
+                continue
+
+            for q in request_qs.values():
+                q.put(user)
+            texts, stats, dead = {n: "" for n in names}, {}, {}
+            with Live(render(names, texts, stats), console=console, refresh_per_second=12) as live:
+                while len(stats) + len(dead) < len(names):
+                    pending = [n for n in names if n not in stats and n not in dead]
+                    kind, name, payload = next_event(events_q, procs, pending)
+                    if kind == "token":
+                        texts[name] += payload
+                    elif kind == "done":
+                        texts[name] = payload["reply"]
+                        stats[name] = payload
+                    elif kind == "exit":
+                        dead[name] = payload
+                        texts[name] += f"\n(进程已退出, exit code {payload})"
+                    live.update(render(names, texts, stats))
+            console.print()
+            for name, code in dead.items():
+                console.print(f"[red]{name} worker exited with code {code}; continuing without it.")
+                names.remove(name)
+                request_qs.pop(name)
+                store.end_session(sessions.pop(name))
+            if not names:
+                console.print("[red]No model left, exiting.")
+                break
+
+            record = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "prompt": user, "results": {}}
+            for name in names:
+                st = stats[name]
+                record["results"][name] = {k: st[k] for k in ("reply", "ttft", "latency", "tokens", "tok_s", "rss_mb")}
+                store.log_turn(
+                    sessions[name], user, st["reply"], model=model_key(MODELS[name][1]), latency=st["latency"],
+                    ttft=st["ttft"], tokens=st["tokens"], rss_mb=st["rss_mb"], tok_s=st["tok_s"],
+                )
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+    for sid in sessions.values():
+        store.end_session(sid)
+    store.close()
+    for q in request_qs.values():
+        q.put(None)
+    for p in procs.values():
+        p.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Model URLs / local paths shared by the task2 scripts, plus the downloader."""
+
+import os
+
+# 名称 -> (下载地址, 本地路径)
+MODELS = {
+    "Mistral-7B-Instruct": (
+        "https://huggingface.co/TheBloke/Mistral-7B-Instruct-v0.2-GGUF/resolve/main/mistral-7b-instruct-v0.2.Q4_K_M.gguf",
+        "./models/mistral-7b-instruct.Q4_K_M.gguf",
+    ),
+    "Orca-Mini-3B": (
+        "https://huggingface.co/Aryanne/Orca-Mini-3B-gguf/resolve/main/q4_0-orca-mini-3b.gguf",
+        "./models/orca-mini-3b.Q4_0.gguf",
+    ),
+}
+
+
+def download_model(url, save_path, console=None):
+    """Download ``url`` to ``save_path`` unless it is already there."""
+    say = console.print if console is not None else print
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    if not os.path.exists(save_path):
+        import requests  # 只在真正需要下载时导入
+
+        say(f"[yellow]Downloading model from {url} ... (may take a while)")
+        with requests.get(url, stream=True) as r:
+            r.raise_for_status()
+            with open(save_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=8192):
+                    f.write(chunk)
+        say(f"[green]Model downloaded and saved to {save_path}")
+    else:
+        say(f"[cyan]Model already exists at {save_path}")
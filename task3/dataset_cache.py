@@ -0,0 +1,355 @@
+"""Local Arrow cache for evaluation datasets (BoolQ and other parquet/JSONL sets).
+
+A dataset is imported once from its source (a local path or any fsspec URL such
+as ``hf://datasets/google/boolq/...``) into an Arrow IPC file under the cache
+directory.  Later runs memory-map that file, so they work offline and only the
+record batches that are actually touched get paged in.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pyarrow as pa
+
+DEFAULT_CACHE_DIR = "./data/cache"
+DEFAULT_BATCH_SIZE = 4096
+BOOLQ_SPLITS = {
+    "train": "hf://datasets/google/boolq/data/train-00000-of-00001.parquet",
+    "validation": "hf://datasets/google/boolq/data/validation-00000-of-00001.parquet",
+}
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _open_source(source: str):
+    """Open a local path directly, anything with a URL scheme through fsspec."""
+    if "://" in source and not source.startswith("file://"):
+        import fsspec  # only needed for remote sources
+
+        return fsspec.open(source, "rb").open()
+    path = source[len("file://"):] if source.startswith("file://") else source
+    return open(path, "rb")
+
+
+def _iter_parquet_batches(source: str, batch_size: int) -> Iterator[pa.RecordBatch]:
+    import pyarrow.parquet as pq
+
+    with _open_source(source) as fh:
+        parquet_file = pq.ParquetFile(fh)
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield batch
+
+
+def _iter_jsonl_rows(source: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    rows: List[Dict[str, Any]] = []
+    with _open_source(source) as fh:
+        for raw in fh:
+            line = raw.strip()
+            if not line:
+                continue
+            rows.append(json.loads(line))
+            if len(rows) >= batch_size:
+                yield rows
+                rows = []
+    if rows:
+        yield rows
+
+
+def _unify(schemas: List[pa.Schema]) -> pa.Schema:
+    try:
+        return pa.unify_schemas(schemas, promote_options="permissive")
+    except TypeError:  # pyarrow < 14: only null columns get merged
+        return pa.unify_schemas(schemas)
+
+
+def _iter_jsonl_batches(source: str, batch_size: int) -> Iterator[pa.RecordBatch]:
+    """Two passes: unify the schema over every batch, then convert with it.
+
+    The first batch alone cannot decide the schema: a column may be null there
+    and a string later, ints may turn into floats, and keys may first appear
+    deep into the file.
+    """
+    # pa.array over the dicts sees every row's keys; from_pylist only the first row's
+    schemas = [pa.schema(pa.array(rows).type) for rows in _iter_jsonl_rows(source, batch_size)]
+    if not schemas:
+        return
+    schema = _unify(schemas)
+    for rows in _iter_jsonl_rows(source, batch_size):
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+class CachedDataset:
+    """Read-only view over one memory-mapped Arrow IPC file."""
+
+    def __init__(self, path: str, manifest: Dict[str, Any]) -> None:
+        import pyarrow.ipc as ipc
+
+        self.path = path
+        self.manifest = manifest
+        self._source = pa.memory_map(path, "r")
+        self._reader = ipc.open_file(self._source)
+        self._batch_offsets: List[int] = []
+        total = 0
+        for rows in manifest.get("batch_rows", []):
+            self._batch_offsets.append(total)
+            total += rows
+        if len(self._batch_offsets) != self._reader.num_record_batches:
+            # Manifest predates batch bookkeeping; rebuild it from the file.
+            self._batch_offsets = []
+            total = 0
+            for i in range(self._reader.num_record_batches):
+                self._batch_offsets.append(total)
+                total += self._reader.get_batch(i).num_rows
+        self.num_rows = total
+
+    # ------------------------------------------------------------------
+    # Basic access
+    # ------------------------------------------------------------------
+    @property
+    def schema(self) -> pa.Schema:
+        return self._reader.schema
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def close(self) -> None:
+        self._source.close()
+
+    def __enter__(self) -> "CachedDataset":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def iter_batches(self, columns: Optional[Sequence[str]] = None) -> Iterator[pa.RecordBatch]:
+        """Yield record batches lazily, optionally projected to ``columns``."""
+        for i in range(self._reader.num_record_batches):
+            batch = self._reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(list(columns))
+            yield batch
+
+    def iter_rows(self, columns: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        for batch in self.iter_batches(columns):
+            yield from batch.to_pylist()
+
+    # ------------------------------------------------------------------
+    # Sampling
+    # ------------------------------------------------------------------
+    def sample_indices(self, n: int, seed: int) -> List[int]:
+        """Seeded sample of ``n`` row indices, returned in sampled order.
+
+        Draws exactly what ``df.sample(n=n, random_state=seed)`` picks on the
+        full table, so results computed before the cache existed (e.g.
+        ``llm_qa_results.csv`` for seed 306) still match.
+        """
+        import numpy as np
+
+        n = min(max(n, 0), self.num_rows)
+        return np.random.RandomState(seed).choice(self.num_rows, size=n, replace=False).tolist()
+
+    def take(self, indices: Sequence[int], columns: Optional[Sequence[str]] = None) -> pa.Table:
+        """Gather rows by global index, touching only the batches that hold them.
+
+        Rows come back in the order of ``indices``.
+        """
+        import bisect
+
+        by_batch: Dict[int, List[int]] = {}
+        for pos, index in enumerate(indices):
+            if not 0 <= index < self.num_rows:
+                raise IndexError(f"Row index {index} out of range for {self.num_rows} rows")
+            batch_id = bisect.bisect_right(self._batch_offsets, index) - 1
+            by_batch.setdefault(batch_id, []).append(pos)
+
+        pieces: List[pa.RecordBatch] = []
+        order: List[int] = []
+        for batch_id in sorted(by_batch):
+            positions = by_batch[batch_id]
+            batch = self._reader.get_batch(batch_id)
+            if columns is not None:
+                batch = batch.select(list(columns))
+            local = [indices[p] - self._batch_offsets[batch_id] for p in positions]
+            pieces.append(batch.take(pa.array(local, type=pa.int64())))
+            order.extend(positions)
+
+        schema = self.schema if columns is None else pa.schema([self.schema.field(c) for c in columns])
+        if not pieces:
+            return schema.empty_table()
+        table = pa.Table.from_batches(pieces, schema=schema)
+        # Restore the caller's ordering (``order[i]`` is where row i should go).
+        inverse = [0] * len(order)
+        for row, pos in enumerate(order):
+            inverse[pos] = row
+        return table.take(pa.array(inverse, type=pa.int64()))
+
+    def sample(self, n: int, seed: int, columns: Optional[Sequence[str]] = None) -> pa.Table:
+        """Return a reproducible random sample of ``n`` rows as an Arrow table."""
+        return self.take(self.sample_indices(n, seed), columns=columns)
+
+
+class DatasetCache:
+    """Imports datasets into ``cache_dir`` once and hands out memory-mapped views."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR) -> None:
+        self.cache_dir = cache_dir
+
+    def _paths(self, name: str):
+        safe = _SAFE_NAME.sub("_", name)
+        base = os.path.join(self.cache_dir, safe)
+        return base + ".arrow", base + ".json"
+
+    def has(self, name: str) -> bool:
+        data_path, manifest_path = self._paths(name)
+        return os.path.exists(data_path) and os.path.exists(manifest_path)
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        manifests = []
+        for filename in sorted(os.listdir(self.cache_dir)):
+            if filename.endswith(".json"):
+                with open(os.path.join(self.cache_dir, filename), "r", encoding="utf-8") as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    def import_dataset(
+        self,
+        name: str,
+        source: str,
+        *,
+        fmt: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        refresh: bool = False,
+    ) -> Dict[str, Any]:
+        """Stream ``source`` into the cache batch by batch and return its manifest.
+
+        ``fmt`` is ``"parquet"`` or ``"jsonl"``; it is guessed from the file
+        extension when omitted.  Existing entries are kept unless ``refresh``.
+        """
+        import pyarrow.ipc as ipc
+
+        data_path, manifest_path = self._paths(name)
+        if self.has(name) and not refresh:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        if fmt is None:
+            lowered = source.lower()
+            if lowered.endswith((".jsonl", ".ndjson", ".json")):
+                fmt = "jsonl"
+            else:
+                fmt = "parquet"
+        if fmt == "parquet":
+            batches = _iter_parquet_batches(source, batch_size)
+        elif fmt == "jsonl":
+            batches = _iter_jsonl_batches(source, batch_size)
+        else:
+            raise ValueError(f"Unsupported dataset format: {fmt}")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = data_path + ".tmp"
+        batch_rows: List[int] = []
+        schema: Optional[pa.Schema] = None
+        writer = None
+        try:
+            try:
+                for batch in batches:
+                    if writer is None:
+                        schema = batch.schema
+                        writer = ipc.new_file(tmp_path, schema)
+                    writer.write_batch(batch)
+                    batch_rows.append(batch.num_rows)
+                if writer is None:
+                    raise ValueError(f"Dataset source is empty: {source}")
+            finally:
+                if writer is not None:
+                    writer.close()
+            os.replace(tmp_path, data_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        manifest = {
+            "name": name,
+            "source": source,
+            "format": fmt,
+            "num_rows": sum(batch_rows),
+            "batch_rows": batch_rows,
+            "columns": list(schema.names) if schema is not None else [],
+            "imported_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+    def open(self, name: str) -> CachedDataset:
+        data_path, manifest_path = self._paths(name)
+        if not self.has(name):
+            raise FileNotFoundError(f"Dataset '{name}' is not cached in {self.cache_dir}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return CachedDataset(data_path, manifest)
+
+    def load(self, name: str, source: str, **import_kwargs: Any) -> CachedDataset:
+        """Import on first use, then open the cached copy."""
+        self.import_dataset(name, source, **import_kwargs)
+        return self.open(name)
+
+
+def load_boolq(split: str = "train", cache_dir: str = DEFAULT_CACHE_DIR) -> CachedDataset:
+    return DatasetCache(cache_dir).load(f"boolq-{split}", BOOLQ_SPLITS[split])
+
+
+def main() -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Manage the local evaluation dataset cache.")
+    ap.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Import a parquet/JSONL dataset into the cache")
+    imp.add_argument("name")
+    imp.add_argument("source", help="Local path or fsspec URL (e.g. hf://datasets/...)")
+    imp.add_argument("--format", dest="fmt", choices=["parquet", "jsonl"], default=None)
+    imp.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    imp.add_argument("--refresh", action="store_true")
+
+    sub.add_parser("boolq", help="Import both BoolQ splits")
+    sub.add_parser("list", help="List cached datasets")
+
+    sample = sub.add_parser("sample", help="Print a seeded sample as JSON lines")
+    sample.add_argument("name")
+    sample.add_argument("-n", type=int, default=5)
+    sample.add_argument("--seed", type=int, default=0)
+    sample.add_argument("--columns", type=str, default=None, help="Comma-separated column names")
+
+    args = ap.parse_args()
+    cache = DatasetCache(args.cache_dir)
+    if args.command == "import":
+        manifest = cache.import_dataset(
+            args.name, args.source, fmt=args.fmt, batch_size=args.batch_size, refresh=args.refresh
+        )
+        print(f"{manifest['name']}: {manifest['num_rows']} rows -> {cache.cache_dir}")
+    elif args.command == "boolq":
+        for split, source in BOOLQ_SPLITS.items():
+            manifest = cache.import_dataset(f"boolq-{split}", source)
+            print(f"{manifest['name']}: {manifest['num_rows']} rows")
+    elif args.command == "list":
+        for manifest in cache.list():
+            print(f"{manifest['name']:<24} {manifest['num_rows']:>8} rows  {manifest['source']}")
+    elif args.command == "sample":
+        columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+        with cache.open(args.name) as ds:
+            for row in ds.sample(args.n, args.seed, columns=columns).to_pylist():
+                print(json.dumps(row, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""BoolQ yes/no evaluation on a local llama.cpp model with a prefix KV cache.
+
+Every sampled question is asked once per prompt template (zero-shot and
+few-shot by default), alternating on one model.  Each template starts with its
+own fixed block, so plain llama.cpp would re-prefill the few-shot block after
+every zero-shot prompt; with ``ChatBot``'s prefix cache the saved state for
+that block is loaded instead and only the question is evaluated.
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task4"))
+from dataset_cache import load_boolq
+
+DEFAULT_MODEL = "./models/orca-mini-3b.Q4_0.gguf"
+INSTRUCTION = "You are a yes/no classifier.\nAnswer with YES or NO only.\n\n"
+
+
+def parse_yes_no(ans):
+    # 与 model_test.ipynb 相同：包含 yes -> True；包含 no -> False；其他 -> None
+    a = (ans or "").strip().lower()
+    if "yes" in a:
+        return True
+    if "no" in a:
+        return False
+    return None
+
+
+def normalize_gold(x):
+    if x is None or (isinstance(x, float) and math.isnan(x)):
+        return None
+    if isinstance(x, bool):
+        return x
+    s = str(x).strip().lower()
+    if s in {"true", "yes", "1"}:
+        return True
+    if s in {"false", "no", "0"}:
+        return False
+    return None
+
+
+def build_headers(examples):
+    """Fixed leading block of each template; the question is appended to it."""
+    shots = "".join(
+        f"Question: {ex['question']}\nAnswer: {'YES' if normalize_gold(ex['answer']) else 'NO'}\n\n"
+        for ex in examples
+    )
+    return {"zero-shot": INSTRUCTION, "few-shot": INSTRUCTION + shots}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="BoolQ 评测（本地 llama.cpp 模型 + 前缀 KV 缓存）")
+    ap.add_argument("--model", type=str, default=DEFAULT_MODEL)
+    ap.add_argument("--n", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=306)
+    ap.add_argument("--shots", type=int, default=4, help="examples in the few-shot header")
+    ap.add_argument("--cache-mb", type=float, default=512, help="prefix cache size (0 disables it)")
+    ap.add_argument("--max-tokens", type=int, default=8)
+    ap.add_argument("--out", type=str, default="runs/boolq_eval.csv")
+    args = ap.parse_args()
+
+    from chat_backend import ChatBot
+
+    ds = load_boolq("train")
+    indices = ds.sample_indices(args.n + args.shots, args.seed)
+    # The first draws become the few-shot examples and are not evaluated
+    shot_rows = ds.take(indices[: args.shots], columns=["question", "answer"]).to_pylist()
+    eval_indices = indices[args.shots :]
+    rows = ds.take(eval_indices, columns=["question", "answer"]).to_pylist()
+    headers = build_headers(shot_rows)
+
+    bot = ChatBot(args.model, prefix_cache_mb=args.cache_mb, context_shift=False)
+    if bot.prefix_cache is not None:
+        # Reuse only pays off for the shared template block, not for BOS + a word or two
+        shortest = min(len(bot.llm.tokenize(h.encode("utf-8"))) for h in headers.values())
+        bot.prefix_cache.min_prefix_tokens = shortest
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    correct = {name: 0 for name in headers}
+    valid = {name: 0 for name in headers}
+    t0 = time.time()
+    with open(args.out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Row", "Template", "Question", "LLM_Answer", "Parsed", "Gold_Answer", "Latency"])
+        for row_id, row in zip(eval_indices, rows):
+            gold = normalize_gold(row["answer"])
+            for name, header in headers.items():
+                prompt = f"{header}Question: {row['question']}\nAnswer:"
+                ans, dt = bot.complete(prompt, temperature=0.0, max_tokens=args.max_tokens, stop=["\n"])
+                parsed = parse_yes_no(ans)
+                writer.writerow([row_id, name, row["question"], ans, parsed, row["answer"], f"{dt:.3f}"])
+                if isinstance(parsed, bool) and isinstance(gold, bool):
+                    valid[name] += 1
+                    correct[name] += parsed == gold
+
+    print(f"{len(rows)} questions x {len(headers)} templates in {time.time() - t0:.1f}s -> {args.out}")
+    for name in headers:
+        acc = correct[name] / valid[name] if valid[name] else 0.0
+        print(f"[Accuracy] {name:<10} {correct[name]}/{valid[name]} = {acc:.2%}")
+    stats = bot.cache_stats()
+    if stats:
+        print(
+            f"[Prefix cache] hit rate {stats['hit_rate']:.0%}, {stats['reused_tokens']} tokens reused, "
+            f"{stats['entries']} states, {stats['size_mb']:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
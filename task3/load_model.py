@@ -1,15 +1,31 @@
-from gpt4all import GPT4All
+import argparse
 
 # 推荐：Orca-mini-3B，Q4 量化版（约 3.6GB）
-model = GPT4All("orca-mini-3b-gguf2-q4_0.gguf")
-
-# 进入交互模式
-with model.chat_session() as session:
-    print("已进入 GPT4All 交互模式，输入 exit 或 quit 退出。\n")
-    while True:
-        user_input = input("你：")
-        if user_input.strip().lower() in ["exit", "quit"]:
-            print("已退出 GPT4All 交互模式。")
-            break
-        response = session.generate(user_input, max_tokens=200)
-        print("AI：", response)
+DEFAULT_MODEL = "orca-mini-3b-gguf2-q4_0.gguf"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="GPT4All 交互模式")
+    ap.add_argument("--model", type=str, default=DEFAULT_MODEL, help="GPT4All model file name")
+    ap.add_argument("--max-tokens", type=int, default=200)
+    args = ap.parse_args()
+
+    # gpt4all 加载较慢，只在真正需要模型时导入
+    from gpt4all import GPT4All
+
+    model = GPT4All(args.model)
+
+    # 进入交互模式
+    with model.chat_session() as session:
+        print("已进入 GPT4All 交互模式，输入 exit 或 quit 退出。\n")
+        while True:
+            user_input = input("你：")
+            if user_input.strip().lower() in ["exit", "quit"]:
+                print("已退出 GPT4All 交互模式。")
+                break
+            response = session.generate(user_input, max_tokens=args.max_tokens)
+            print("AI：", response)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Difficulty-based cascade between a small and a large local model.
+
+Every turn goes to the small model (Orca-Mini-3B) first unless a cheap text
+classifier already marks the question as hard.  While the small model
+decodes, a logits processor records how confident it was about each token
+(top-1 probability of the raw distribution).  No ``logits_all`` buffer is
+needed for this.  A confident answer is returned as is.  An unsure one is
+thrown away and the turn is escalated to the large model (Mistral-7B).
+
+Both bots come from a ``BotRegistry``, so a model the front end already has
+resident is reused rather than loaded twice, and everything shares one
+``MemoryGovernor`` budget.  The large model loads on its first escalation,
+and either model can be evicted and reloaded when both do not fit.  Each turn leaves a
+``RouteDecision`` recording the route, the reason, the confidence and the
+estimated latency saved compared with always using the large model.
+"""
+
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from chat_backend import DEFAULT_SYSTEM_PROMPT, BotRegistry, ChatBot
+from memory_governor import MemoryGovernor
+
+SMALL_MODEL = "./models/orca-mini-3b.Q4_0.gguf"
+LARGE_MODEL = "./models/mistral-7b-instruct.Q4_K_M.gguf"
+
+_HARD_WORDS = re.compile(
+    r"\b(why|explain|compare|comparison|difference|versus|vs|recommend|plan|calculate|step|reason|pros|cons)\b"
+    r"|为什么|解释|比较|区别|推荐|计算|步骤|原因",
+    re.IGNORECASE,
+)
+
+
+def difficulty_score(text: str) -> float:
+    """Cheap 0..1 estimate of how hard a question is, from its text alone."""
+    words = len(text.split())
+    score = min(words / 80.0, 1.0) * 0.35
+    score += min(text.count("?") + text.count("？"), 3) / 3 * 0.2
+    score += min(len(_HARD_WORDS.findall(text)), 2) / 2 * 0.3
+    if re.search(r"\d+\s*[-+*/x×]\s*\d+|```", text):
+        score += 0.15
+    return min(score, 1.0)
+
+
+class ConfidenceMeter:
+    """Logits processor that records the top-1 probability at each step."""
+
+    def __init__(self) -> None:
+        import numpy as np
+
+        self._np = np
+        self.top_probs: List[float] = []
+
+    def __call__(self, input_ids: Any, scores: Any) -> Any:
+        np = self._np
+        # p_max = 1 / sum(exp(logit - max_logit)), no full softmax needed
+        self.top_probs.append(float(1.0 / np.exp(scores - scores.max()).sum()))
+        return scores
+
+    def summary(self, low: float) -> Dict[str, float]:
+        n = len(self.top_probs)
+        if not n:
+            # Nothing was sampled (e.g. a canned "(当前模型不支持图片输入)"): not a model answer
+            return {"tokens": 0, "mean": 0.0, "low_fraction": 1.0}
+        return {
+            "tokens": n,
+            "mean": sum(self.top_probs) / n,
+            "low_fraction": sum(p < low for p in self.top_probs) / n,
+        }
+
+
+@dataclass
+class RouteDecision:
+    route: str  # "small", "escalated" or "large"
+    reason: str
+    difficulty: float
+    confidence: Optional[float] = None
+    low_fraction: Optional[float] = None
+    small_latency: Optional[float] = None
+    large_latency: Optional[float] = None
+    saved_s: float = 0.0
+    ts: float = field(default_factory=time.time)
+
+
+class CascadeBot:
+    """``ChatBot``-compatible front that routes each turn small-first."""
+
+    def __init__(
+        self,
+        small_model_path: str = SMALL_MODEL,
+        large_model_path: str = LARGE_MODEL,
+        *,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        governor: Optional[MemoryGovernor] = None,
+        registry: Optional[BotRegistry] = None,
+        difficulty_threshold: float = 0.5,
+        confidence_threshold: float = 0.6,
+        low_prob: float = 0.35,
+        max_low_fraction: float = 0.3,
+        large_speed_ratio: float = 2.0,
+        **bot_kwargs: Any,
+    ) -> None:
+        self.system_prompt = system_prompt
+        self.registry = registry if registry is not None else BotRegistry(governor)
+        self.governor = self.registry.governor
+        self.difficulty_threshold = difficulty_threshold
+        self.confidence_threshold = confidence_threshold
+        self.low_prob = low_prob
+        self.max_low_fraction = max_low_fraction
+        # Large/small seconds-per-token ratio until both have been measured
+        self.large_speed_ratio = large_speed_ratio
+        self.small = self.registry.get(small_model_path, system_prompt=system_prompt, **bot_kwargs)
+        self.large = self.registry.get(large_model_path, system_prompt=system_prompt, preload=False, **bot_kwargs)
+        self.messages: List[Dict[str, Any]] = []
+        self.decisions: List[RouteDecision] = []
+        self.last_decision: Optional[RouteDecision] = None
+        self.last_turn_shifts = 0
+        self._s_per_token: Dict[str, Optional[float]] = {"small": None, "large": None}
+        self.reset()
+
+    # ------------------------------------------------------------------
+    # ChatBot-compatible surface
+    # ------------------------------------------------------------------
+    @property
+    def supports_images(self) -> bool:
+        return False
+
+    def reset(self) -> None:
+        self.messages = [{"role": "system", "content": self.system_prompt}]
+
+    def unload(self) -> None:
+        self.small.unload()
+        self.large.unload()
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+    def _ask(
+        self, bot: ChatBot, user_input: str, meter: ConfidenceMeter, **params: Any
+    ) -> Tuple[str, float, float]:
+        from llama_cpp import LogitsProcessorList
+
+        # Each bot works on a copy of the shared history; only the answer
+        # that is kept is written back.
+        bot.messages = list(self.messages)
+        return bot.chat(user_input, logits_processor=LogitsProcessorList([meter]), **params)
+
+    def _observe(self, size: str, latency: float, tokens: float) -> None:
+        if tokens <= 0:
+            return
+        rate = latency / tokens
+        previous = self._s_per_token[size]
+        self._s_per_token[size] = rate if previous is None else 0.7 * previous + 0.3 * rate
+
+    def _estimate_large(self, small_latency: float) -> float:
+        small, large = self._s_per_token["small"], self._s_per_token["large"]
+        ratio = large / small if small and large else self.large_speed_ratio
+        return small_latency * ratio
+
+    def _confident(self, conf: Dict[str, float]) -> bool:
+        return conf["mean"] >= self.confidence_threshold and conf["low_fraction"] <= self.max_low_fraction
+
+    def chat(
+        self,
+        user_input: str,
+        *,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        max_tokens: int = 512,
+        repeat_penalty: float = 1.1,
+        on_token: Optional[Callable[[str], None]] = None,
+        images: Optional[Sequence[Any]] = None,
+    ) -> Tuple[str, float, float]:
+        """Run one routed turn and return ``(reply, elapsed_seconds, rss_mb)``.
+
+        Small-model output is not streamed since it may be discarded; when it
+        is kept, ``on_token`` receives the whole reply at once.
+        """
+        start = time.time()
+        params = dict(temperature=temperature, top_p=top_p, max_tokens=max_tokens, repeat_penalty=repeat_penalty)
+        difficulty = difficulty_score(user_input)
+        decision: RouteDecision
+
+        if difficulty >= self.difficulty_threshold:
+            meter = ConfidenceMeter()
+            reply, large_latency, mem = self._ask(self.large, user_input, meter, on_token=on_token, **params)
+            self._observe("large", large_latency, len(meter.top_probs))
+            bot = self.large
+            decision = RouteDecision("large", "classifier", difficulty, large_latency=large_latency)
+        else:
+            meter = ConfidenceMeter()
+            reply, small_latency, mem = self._ask(self.small, user_input, meter, images=images, **params)
+            self._observe("small", small_latency, len(meter.top_probs))
+            conf = meter.summary(self.low_prob)
+            failed = reply.startswith("(模型")  # call failed or returned nothing
+            if not failed and self._confident(conf):
+                bot = self.small
+                decision = RouteDecision(
+                    "small", "confident", difficulty, conf["mean"], conf["low_fraction"],
+                    small_latency=small_latency,
+                    saved_s=self._estimate_large(small_latency) - small_latency,
+                )
+                if on_token is not None:
+                    on_token(reply)
+            else:
+                meter_large = ConfidenceMeter()
+                reply, large_latency, mem = self._ask(self.large, user_input, meter_large, on_token=on_token, **params)
+                self._observe("large", large_latency, len(meter_large.top_probs))
+                bot = self.large
+                decision = RouteDecision(
+                    "escalated", "small_error" if failed else "low_confidence", difficulty,
+                    conf["mean"], conf["low_fraction"],
+                    small_latency=small_latency, large_latency=large_latency,
+                    saved_s=-small_latency,  # the discarded attempt is pure overhead
+                )
+
+        self.messages = bot.messages
+        self.last_turn_shifts = bot.last_turn_shifts
+        self.last_decision = decision
+        self.decisions.append(decision)
+        return reply, time.time() - start, mem
+
+    def routing_stats(self) -> Dict[str, Any]:
+        """Route counts, escalation rate and total estimated latency saved."""
+        counts = {"small": 0, "escalated": 0, "large": 0}
+        for decision in self.decisions:
+            counts[decision.route] += 1
+        turns = len(self.decisions)
+        return {
+            "turns": turns,
+            **counts,
+            "small_rate": counts["small"] / turns if turns else 0.0,
+            "escalation_rate": counts["escalated"] / (counts["small"] + counts["escalated"] or 1),
+            "saved_s": sum(d.saved_s for d in self.decisions),
+            "s_per_token": dict(self._s_per_token),
+        }
+
+    def decision_records(self) -> List[Dict[str, Any]]:
+        return [asdict(d) for d in self.decisions]
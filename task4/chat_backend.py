@@ -1,13 +1,28 @@
-"""Backend helpers for running local llama.cpp models in a chat loop."""
+"""Backend helpers for running local llama.cpp models in a chat loop.
+
+Importing this module is cheap: ``llama_cpp`` (and numpy with it) is only
+imported when a model is actually loaded, so front ends can show their
+window or ``--help`` before paying for it.
+"""
 
 from __future__ import annotations
 
+import inspect
 import os
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import tracing
+from memory_governor import MB, MemoryGovernor, estimate_kv_mb, estimate_model_mb
+from sampling_sweep import SweepConfig, SweepResult, parameter_grid, render_chat_prompt, run_sweep
+from structured_output import RECEPTIONIST_SCHEMA, grammar_for, parse_structured, structured_prompt
 
-import psutil
-from llama_cpp import Llama
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+    from image_embeds import ClipEncoder, ImageEmbedding, ImageEmbeddingCache, ImageSource
+    from prefix_cache import PrefixCache
 
 DEFAULT_MODEL = "./models/orca-mini-3b.Q4_0.gguf"
 DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
@@ -37,10 +52,20 @@ class ChatBot:
         n_gpu_layers: int = 20,
         verbose: bool = False,
         llm_kwargs: Optional[Dict[str, Any]] = None,
+        governor: Optional[MemoryGovernor] = None,
+        clip_model_path: Optional[str] = None,
+        image_cache: Optional[ImageEmbeddingCache] = None,
+        prefix_cache_mb: float = 0.0,
+        prefix_min_tokens: int = 16,
+        context_shift: bool = True,
+        preload: bool = True,
     ) -> None:
         self.model_path = model_path
+        self.clip_model_path = clip_model_path
         self.system_prompt = system_prompt
         self.history_pairs = max(history_pairs, 0)
+        import psutil
+
         self._process = psutil.Process()
         base_config: Dict[str, Any] = dict(
             n_ctx=n_ctx,
@@ -51,10 +76,39 @@ class ChatBot:
         if llm_kwargs:
             base_config.update(llm_kwargs)
         self._llm_config = base_config
+        self.governor = governor
+        self._resident_name = f"{os.path.basename(model_path)}#{id(self):x}"
         self.llm: Optional[Llama] = None
+        self.clip: Optional[ClipEncoder] = None
+        self.image_cache = image_cache
+        # Shared-prefix KV states reused across independent requests (0 disables)
+        self.prefix_cache: Optional[PrefixCache] = None
+        if prefix_cache_mb > 0:
+            from prefix_cache import PrefixCache
+
+            self.prefix_cache = PrefixCache(
+                int(prefix_cache_mb * MB),
+                governor=governor,
+                name=f"prefix-cache:{self._resident_name}",
+                min_prefix_tokens=prefix_min_tokens,
+            )
+        if clip_model_path and self.image_cache is None:
+            from image_embeds import ImageEmbeddingCache
+
+            self.image_cache = ImageEmbeddingCache(governor=governor)
+        # Positions currently in the KV cache for llava turns: token ids, or the
+        # image key for every position an image embedding occupies.
+        self._mm_ids: List[Union[int, str]] = []
+        # Slide the KV window past n_ctx instead of failing long replies
+        self.context_shift = context_shift
+        self.last_turn_shifts = 0
+        self.total_shifts = 0
         self.mode: str = "base"
-        self.messages: List[Dict[str, str]] = []
-        self.load_model()
+        self.messages: List[Dict[str, Any]] = []
+        if preload:
+            self.load_model()
+        else:
+            self.reset()  # the first turn loads the model
 
     # ------------------------------------------------------------------
     # Model management
@@ -65,16 +119,67 @@ class ChatBot:
             return "chat"
         return "base"
 
-    def load_model(self) -> None:
+    def _load_llm(self) -> None:
         config = dict(self._llm_config)
         config["model_path"] = self.model_path
-        self.llm = Llama(**config)
+        if self.governor is not None:
+            config["n_ctx"] = self.governor.plan_load(
+                self._resident_name, self.model_path, config["n_ctx"]
+            )
+        with tracing.span("load_model", model=os.path.basename(self.model_path)):
+            if self.context_shift:
+                from context_shift import ShiftingLlama
+
+                self.llm = ShiftingLlama(on_shift=self._on_shift, **config)
+            else:
+                from llama_cpp import Llama
+
+                self.llm = Llama(**config)
+        if tracing.is_enabled():
+            tracing.instrument_llama(self.llm)
+        if self.prefix_cache is not None:
+            self.llm.set_cache(self.prefix_cache)
         self.mode = self._guess_mode(self.model_path)
+        if self.clip_model_path:
+            from image_embeds import ClipEncoder
+
+            self.clip = ClipEncoder(self.clip_model_path, n_threads=config["n_threads"], verbose=config["verbose"])
+            self.mode = "llava"
+        self._mm_ids = []
+        if self.governor is not None:
+            size_mb = estimate_model_mb(self.model_path) + estimate_kv_mb(self.model_path, config["n_ctx"])
+            self.governor.register(self._resident_name, size_mb, kind="model", evict=self.unload)
+
+    def load_model(self) -> None:
+        self._load_llm()
         self.reset()
 
+    def ensure_loaded(self) -> None:
+        """Load the model if it is not resident (history is kept)."""
+        if self.llm is None:
+            self._load_llm()
+
+    def unload(self) -> None:
+        """Drop the model (history is kept; the next turn reloads it)."""
+        llm, self.llm = self.llm, None
+        clip, self.clip = self.clip, None
+        if clip is not None:
+            clip.close()
+        if llm is not None and hasattr(llm, "close"):
+            llm.close()
+        if self.prefix_cache is not None:
+            self.prefix_cache.clear()
+        self._mm_ids = []
+        if self.governor is not None:
+            self.governor.release(self._resident_name)
+
     def reset(self) -> None:
         self.messages = [{"role": "system", "content": self.system_prompt}]
 
+    @property
+    def supports_images(self) -> bool:
+        return bool(self.clip_model_path)
+
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
@@ -97,6 +202,22 @@ class ChatBot:
             print(f"[ChatBot] Failed to extract text: {exc}")
         return ""
 
+    def _consume_stream(
+        self, chunks: Iterable[Dict[str, Any]], on_token: Callable[[str], None]
+    ) -> str:
+        parts: List[str] = []
+        for chunk in chunks:
+            choices = chunk.get("choices", [])
+            if not choices:
+                continue
+            first = choices[0]
+            delta = first.get("delta")
+            piece = delta.get("content", "") if isinstance(delta, dict) else first.get("text", "")
+            if piece:
+                parts.append(piece)
+                on_token(piece)
+        return "".join(parts)
+
     def _build_inst_prompt(self, user_input: str, history_limit: Optional[int] = None) -> str:
         limit = self.history_pairs if history_limit is None else max(history_limit, 0)
         dialog = []
@@ -114,6 +235,43 @@ class ChatBot:
         body_lines.append(f"User: {user_input}\nAssistant:")
         return f"[INST] {header}{''.join(body_lines)} [/INST]"
 
+    def _on_shift(self, n_keep: int, n_discard: int) -> None:
+        self.last_turn_shifts += 1
+        self.total_shifts += 1
+
+    def _system_prefix(self) -> str:
+        """Leading prompt text that context shifting must never drop."""
+        if self.mode == "chat":
+            return self.system_prompt
+        if self.mode == "llava":
+            return f"{self.system_prompt}\n\n"
+        return f"[INST] <<SYS>>\n{self.system_prompt}\n<</SYS>>\n"
+
+    def _update_n_keep(self) -> None:
+        if not hasattr(self.llm, "shift_context"):
+            return
+        n_keep = len(self.llm.tokenize(self._system_prefix().encode("utf-8"), special=True))
+        if self.mode == "chat":
+            n_keep += 8  # role markers the chat template wraps around the system prompt
+        self.llm.n_keep = n_keep
+
+    def _fit_history(self, user_input: str, max_tokens: int) -> None:
+        """Drop the oldest turns until the prompt leaves room for the reply."""
+        assert self.llm is not None
+        n_ctx = self.llm.n_ctx()
+        budget = n_ctx - min(max_tokens, n_ctx // 4)
+
+        def cost(text: str) -> int:
+            return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False)) + 8
+
+        used = cost(self.system_prompt) + cost(user_input)
+        sizes = [cost(m.get("content", "")) for m in self.messages[1:]]
+        drop = 0
+        while drop < len(sizes) and used + sum(sizes[drop:]) > budget:
+            drop += 2 if drop + 1 < len(sizes) else 1
+        if drop:
+            self.messages = self.messages[:1] + self.messages[1 + drop :]
+
     def _trim_history(self) -> None:
         if self.history_pairs <= 0:
             return
@@ -135,19 +293,164 @@ class ChatBot:
         max_tokens: int,
         repeat_penalty: float,
         record_user: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+        logits_processor: Optional[Callable[..., Any]] = None,
     ) -> str:
         assert self.llm is not None, "Model not loaded"
-        prompt = self._build_inst_prompt(user_input)
-        output = self.llm(
-            prompt,
+        with tracing.span("text_completion", fallback=not record_user):
+            with tracing.span("build_inst_prompt"):
+                prompt = self._build_inst_prompt(user_input)
+            tracing.begin_completion("text")
+            output = self.llm(
+                prompt,
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                repeat_penalty=repeat_penalty,
+                stream=on_token is not None,
+                logits_processor=logits_processor,
+            )
+            if on_token is not None:
+                reply = self._consume_stream(output, on_token).strip()
+            else:
+                reply = self._extract_text(output).strip()
+        if record_user:
+            self.messages.append({"role": "user", "content": user_input})
+        self.messages.append({"role": "assistant", "content": reply})
+        self._trim_history()
+        return reply
+
+    def _image_embedding(self, image: Dict[str, Any]) -> ImageEmbedding:
+        assert self.llm is not None and self.clip is not None and self.image_cache is not None
+        with tracing.span("image_cache_lookup"):
+            embedding = self.image_cache.get(image["key"])
+        if embedding is None:
+            from image_embeds import read_image_bytes
+
+            with tracing.span("image_encode"):
+                image_bytes = read_image_bytes(image["source"])
+                embedding = self.clip.encode(image_bytes, image["key"], self.llm.n_embd())
+                self.image_cache.put(embedding, self.llm.n_embd())
+        return embedding
+
+    def _llava_segments(self, user_input: str, images: List[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+        """LLaVA-1.5 prompt as ("text", str) / ("image", image) segments."""
+        segments: List[Tuple[str, Any]] = [("text", f"{self.system_prompt}\n\n")]
+        turns = [m for m in self.messages[1:] if m.get("role") in {"user", "assistant"}]
+        turns.append({"role": "user", "content": user_input, "images": images})
+        for msg in turns:
+            if msg["role"] == "user":
+                segments.append(("text", "USER: "))
+                for image in msg.get("images", []):
+                    segments.append(("image", image))
+                    segments.append(("text", "\n"))
+                segments.append(("text", f"{msg.get('content', '')}\n"))
+            else:
+                segments.append(("text", f"ASSISTANT: {msg.get('content', '')}\n"))
+        segments.append(("text", "ASSISTANT:"))
+        return segments
+
+    def _llava_layout(
+        self, user_input: str, attached: List[Dict[str, Any]]
+    ) -> Tuple[List[Tuple[str, Any]], List[Union[int, str]]]:
+        """Tokenized segments plus the id (or image key) of every KV position."""
+        assert self.llm is not None
+        plan: List[Tuple[str, Any]] = []
+        target: List[Union[int, str]] = []
+        for index, (kind, value) in enumerate(self._llava_segments(user_input, attached)):
+            if kind == "text":
+                tokens = self.llm.tokenize(value.encode("utf-8"), add_bos=index == 0, special=True)
+                plan.append(("text", tokens))
+                target.extend(tokens)
+            else:
+                embedding = self._image_embedding(value)
+                plan.append(("image", embedding))
+                target.extend([embedding.key] * embedding.n_image_pos)
+        return plan, target
+
+    def _call_multimodal(
+        self,
+        user_input: str,
+        images: Sequence[ImageSource],
+        *,
+        temperature: float,
+        top_p: float,
+        max_tokens: int,
+        repeat_penalty: float,
+        on_token: Optional[Callable[[str], None]] = None,
+        logits_processor: Optional[Callable[..., Any]] = None,
+    ) -> str:
+        assert self.llm is not None and self.clip is not None and self.image_cache is not None
+        from image_embeds import read_image_bytes
+
+        llm = self.llm
+        attached = []
+        for source in images:
+            image_bytes = read_image_bytes(source)
+            key = self.image_cache.key_for(image_bytes, self.clip_model_path or "")
+            attached.append({"key": key, "source": source})
+
+        # Lay out the whole prompt, then only evaluate what the KV cache lacks.
+        plan, target = self._llava_layout(user_input, attached)
+        if self.context_shift:
+            # Image positions cannot be trimmed token by token, so drop whole
+            # old turns until the reply has room.
+            budget = llm.n_ctx() - min(max_tokens, llm.n_ctx() // 4)
+            while len(target) > budget and len(self.messages) > 1:
+                drop = 2 if len(self.messages) > 2 else 1
+                self.messages = self.messages[:1] + self.messages[1 + drop :]
+                plan, target = self._llava_layout(user_input, attached)
+        if len(target) >= llm.n_ctx():
+            raise ValueError(f"Prompt ({len(target)} positions) exceeds context window of {llm.n_ctx()}")
+
+        cached = self._mm_ids if len(self._mm_ids) == llm.n_tokens else []
+        prefix = 0
+        for have, want in zip(cached, target[:-1]):
+            if have != want:
+                break
+            prefix += 1
+        llm._ctx.kv_cache_seq_rm(-1, prefix, -1)
+        llm.n_tokens = prefix
+
+        position = 0
+        for kind, value in plan:
+            if kind == "text":
+                end = position + len(value)
+                if end > prefix:
+                    tracing.begin_completion("text")  # each segment is prefill, not decode
+                    llm.eval(value[max(prefix - position, 0):])
+            else:
+                end = position + value.n_image_pos
+                if end > prefix:
+                    if position < prefix:
+                        # Partially cached image: drop it and evaluate it whole.
+                        llm._ctx.kv_cache_seq_rm(-1, position, -1)
+                        llm.n_tokens = prefix = position
+                    with tracing.span("image_prefill", positions=value.n_image_pos):
+                        self.clip.eval_embedding(llm, value)
+            position = end
+
+        tracing.begin_completion("text")
+        output = llm.create_completion(
+            prompt=llm.input_ids[: llm.n_tokens].tolist(),
             temperature=temperature,
             top_p=top_p,
             max_tokens=max_tokens,
             repeat_penalty=repeat_penalty,
+            stop=["USER:", "</s>"],
+            stream=on_token is not None,
+            logits_processor=logits_processor,
         )
-        reply = self._extract_text(output).strip()
-        if record_user:
-            self.messages.append({"role": "user", "content": user_input})
+        if on_token is not None:
+            reply = self._consume_stream(output, on_token).strip()
+        else:
+            reply = self._extract_text(output).strip()
+        if self.last_turn_shifts:
+            self._mm_ids = []  # the window moved; positions no longer line up with target
+        else:
+            self._mm_ids = target + [int(t) for t in llm.input_ids[len(target) : llm.n_tokens]]
+
+        self.messages.append({"role": "user", "content": user_input, "images": attached})
         self.messages.append({"role": "assistant", "content": reply})
         self._trim_history()
         return reply
@@ -155,6 +458,81 @@ class ChatBot:
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
+    def complete(
+        self,
+        prompt: str,
+        *,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        max_tokens: int = 256,
+        repeat_penalty: float = 1.1,
+        stop: Optional[List[str]] = None,
+    ) -> Tuple[str, float]:
+        """One-shot completion outside the conversation history.
+
+        Meant for independent requests such as eval prompts; with a prefix
+        cache, prompts sharing a leading block only evaluate their suffix.
+        Returns ``(text, elapsed_seconds)``.
+        """
+        if self.llm is None:
+            self._load_llm()
+        assert self.llm is not None, "Model not loaded"
+        start = time.time()
+        self._mm_ids = []  # the KV cache no longer holds the llava conversation
+        with tracing.span("complete"):
+            tracing.begin_completion("text")
+            output = self.llm(
+                prompt,
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                repeat_penalty=repeat_penalty,
+                stop=stop or [],
+            )
+        return self._extract_text(output).strip(), time.time() - start
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Prefix-cache counters (empty when the cache is disabled)."""
+        return self.prefix_cache.summary() if self.prefix_cache is not None else {}
+
+    def sweep(
+        self,
+        user_input: str,
+        configs: Optional[Sequence[SweepConfig]] = None,
+        *,
+        max_tokens: int = 128,
+        **grid: Iterable[Any],
+    ) -> SweepResult:
+        """Answer ``user_input`` once per sampling config from a single prefill.
+
+        ``configs`` defaults to ``parameter_grid(**grid)``, e.g.
+        ``bot.sweep(q, temperature=[0.2, 0.8], seed=[0, 1])``.  The prompt is
+        built from the current history like a normal turn, but nothing is
+        added to it.  Print ``result.table()`` to compare the replies.
+        """
+        if self.llm is None:
+            self._load_llm()
+        assert self.llm is not None, "Model not loaded"
+        if self.governor is not None:
+            self.governor.touch(self._resident_name)
+        if configs is None:
+            configs = parameter_grid(**grid)
+        if self.context_shift:
+            self._update_n_keep()
+        stop: List[str] = []
+        added_special = False
+        if self.mode == "chat":
+            messages = [{"role": m["role"], "content": m.get("content", "")} for m in self.messages]
+            messages.append({"role": "user", "content": user_input})
+            prompt, stop, added_special = render_chat_prompt(self.llm, messages)
+        else:
+            prompt = self._build_inst_prompt(user_input)
+        # A template that already wrote BOS must not get a second one
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), add_bos=not added_special, special=True)
+        self._mm_ids = []
+        with tracing.span("sweep", configs=len(configs)):
+            return run_sweep(self.llm, tokens, configs, max_tokens=max_tokens, stop=stop)
+
     def chat(
         self,
         user_input: str,
@@ -163,21 +541,62 @@ class ChatBot:
         top_p: float = 0.9,
         max_tokens: int = 512,
         repeat_penalty: float = 1.1,
+        on_token: Optional[Callable[[str], None]] = None,
+        images: Optional[Sequence[ImageSource]] = None,
+        logits_processor: Optional[Callable[..., Any]] = None,
     ):
+        """Run one turn and return ``(reply, elapsed_seconds, rss_mb)``.
+
+        When ``on_token`` is given the reply is streamed and each text piece is
+        passed to it as soon as the model produces it.  ``images`` (paths or raw
+        bytes) are only accepted when the bot was created with a clip model.
+        ``logits_processor`` is handed to llama.cpp for every sampled token.
+        """
+        if self.llm is None:
+            self._load_llm()
         assert self.llm is not None, "Model not loaded"
+        if self.governor is not None:
+            self.governor.touch(self._resident_name)
         start = time.time()
+        trace_start = tracing.now_us() if tracing.is_enabled() else 0.0
         reply = ""
+        self.last_turn_shifts = 0
         try:
-            if self.mode == "chat":
+            if self.context_shift:
+                self._update_n_keep()
+                if self.mode != "llava":
+                    self._fit_history(user_input, max_tokens)
+            if self.mode == "llava":
+                with tracing.span("multimodal_completion", images=len(images or [])):
+                    reply = self._call_multimodal(
+                        user_input,
+                        images or [],
+                        temperature=temperature,
+                        top_p=top_p,
+                        max_tokens=max_tokens,
+                        repeat_penalty=repeat_penalty,
+                        on_token=on_token,
+                        logits_processor=logits_processor,
+                    )
+            elif images:
+                reply = "(当前模型不支持图片输入)"
+            elif self.mode == "chat":
                 self.messages.append({"role": "user", "content": user_input})
-                output = self.llm.create_chat_completion(
-                    messages=self.messages,
-                    temperature=temperature,
-                    top_p=top_p,
-                    max_tokens=max_tokens,
-                    repeat_penalty=repeat_penalty,
-                )
-                reply = self._extract_text(output).strip()
+                with tracing.span("chat_completion"):
+                    tracing.begin_completion("chat")
+                    output = self.llm.create_chat_completion(
+                        messages=self.messages,
+                        temperature=temperature,
+                        top_p=top_p,
+                        max_tokens=max_tokens,
+                        repeat_penalty=repeat_penalty,
+                        stream=on_token is not None,
+                        logits_processor=logits_processor,
+                    )
+                    if on_token is not None:
+                        reply = self._consume_stream(output, on_token).strip()
+                    else:
+                        reply = self._extract_text(output).strip()
                 if not reply:
                     reply = self._call_text_completion(
                         user_input,
@@ -186,6 +605,8 @@ class ChatBot:
                         max_tokens=max_tokens,
                         repeat_penalty=repeat_penalty,
                         record_user=False,
+                        on_token=on_token,
+                        logits_processor=logits_processor,
                     )
                 else:
                     self.messages.append({"role": "assistant", "content": reply})
@@ -197,6 +618,8 @@ class ChatBot:
                     top_p=top_p,
                     max_tokens=max_tokens,
                     repeat_penalty=repeat_penalty,
+                    on_token=on_token,
+                    logits_processor=logits_processor,
                 )
         except Exception as exc:
             reply = f"(模型调用异常: {exc})"
@@ -205,5 +628,120 @@ class ChatBot:
             reply = "(模型没有返回内容)"
 
         elapsed = time.time() - start
+        if trace_start:
+            tracing.add_span("chat_turn", trace_start, tracing.now_us(), mode=self.mode, chars=len(reply))
+        if self.governor is not None:
+            self.governor.check()
         mem_mb = self._process.memory_info().rss / (1024 ** 2)
         return reply, elapsed, mem_mb
+
+    def chat_structured(
+        self,
+        user_input: str,
+        schema: Optional[Dict[str, Any]] = None,
+        *,
+        temperature: float = 0.2,
+        top_p: float = 0.9,
+        max_tokens: int = 256,
+        repeat_penalty: float = 1.1,
+    ) -> Tuple[Dict[str, Any], float, float]:
+        """Run one turn constrained to ``schema``; returns ``(data, elapsed_seconds, rss_mb)``.
+
+        Decoding follows a grammar compiled from the JSON schema (cached per
+        schema), so the reply always parses.  ``schema`` defaults to the
+        receptionist fields.  Raises ``StructuredReplyError`` when the JSON was
+        cut off by ``max_tokens``.
+        """
+        schema = schema or RECEPTIONIST_SCHEMA
+        if self.llm is None:
+            self._load_llm()
+        assert self.llm is not None, "Model not loaded"
+        if self.governor is not None:
+            self.governor.touch(self._resident_name)
+        start = time.time()
+        self.last_turn_shifts = 0
+        with tracing.span("structured_completion", mode=self.mode):
+            with tracing.span("grammar_for"):
+                grammar = grammar_for(schema)
+            request = structured_prompt(user_input, schema)
+            if self.context_shift:
+                self._update_n_keep()
+                self._fit_history(request, max_tokens)
+            params = dict(
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                repeat_penalty=repeat_penalty,
+                grammar=grammar,
+            )
+            if self.mode == "chat":
+                tracing.begin_completion("chat")
+                history = [{"role": m["role"], "content": m.get("content", "")} for m in self.messages]
+                output = self.llm.create_chat_completion(
+                    messages=history + [{"role": "user", "content": request}], **params
+                )
+            else:
+                tracing.begin_completion("text")
+                output = self.llm(self._build_inst_prompt(request), **params)
+                self._mm_ids = []
+        text = self._extract_text(output).strip()
+        data = parse_structured(text, schema)
+        self.messages.append({"role": "user", "content": user_input})
+        # Keep plain sentences in the history so free-text turns are not nudged into JSON
+        self.messages.append({"role": "assistant", "content": str(data.get("reply", ""))})
+        self._trim_history()
+
+        elapsed = time.time() - start
+        if self.governor is not None:
+            self.governor.check()
+        mem_mb = self._process.memory_info().rss / (1024 ** 2)
+        return data, elapsed, mem_mb
+
+
+class BotRegistry:
+    """Loaded ``ChatBot`` instances keyed by model path and config.
+
+    Front ends that may ask for the same model twice (the GUI switching from
+    a single model to the cascade, say) get the resident instance back instead
+    of a second copy.  Memory stays bounded by the shared governor: every bot
+    registers with it, and a bot it evicted reloads on its next turn.
+    """
+
+    # Per-call switches that do not change what gets loaded
+    _NOT_CONFIG = ("self", "governor", "preload")
+
+    def __init__(self, governor: Optional[MemoryGovernor] = None) -> None:
+        self.governor = governor if governor is not None else MemoryGovernor()
+        self._bots: Dict[Tuple[Any, ...], ChatBot] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _key(cls, model_path: str, kwargs: Dict[str, Any]) -> Tuple[Any, ...]:
+        bound = inspect.signature(ChatBot.__init__).bind(None, model_path, **kwargs)
+        bound.apply_defaults()
+        config = bound.arguments
+        config["model_path"] = os.path.abspath(model_path)
+        return tuple((name, repr(value)) for name, value in config.items() if name not in cls._NOT_CONFIG)
+
+    def get(self, model_path: str, *, preload: bool = True, **kwargs: Any) -> ChatBot:
+        """Resident bot for this model/config, created (and loaded) on first use."""
+        key = self._key(model_path, kwargs)
+        with self._lock:
+            bot = self._bots.get(key)
+            if bot is None:
+                bot = ChatBot(model_path, governor=self.governor, preload=preload, **kwargs)
+                self._bots[key] = bot
+            elif preload:
+                bot.ensure_loaded()
+            return bot
+
+    def bots(self) -> List[ChatBot]:
+        with self._lock:
+            return list(self._bots.values())
+
+    def release_except(self, keep: Iterable[ChatBot]) -> None:
+        """Unload every bot not in ``keep``; they stay registered and reload on use."""
+        keep_ids = {id(bot) for bot in keep}
+        for bot in self.bots():
+            if id(bot) not in keep_ids:
+                bot.unload()
@@ -1,16 +1,19 @@
+import argparse
 import time
 import traceback
 
-import psutil
-
-from chat_backend import ChatBot
+import tracing
+from cascade import CascadeBot
+from chat_backend import BotRegistry
+from memory_governor import MemoryGovernor
+from transcript_store import TranscriptStore, model_key
 import threading
+import os
 import tkinter as tk
-from tkinter import ttk
+from tkinter import filedialog, ttk
 
 # ========== Config ==========
 SYSTEM_PROMPT = "You are a helpful, concise assistant."
-PROCESS = psutil.Process()
 
 PRIMARY_BG = "#f5f6fa"
 CARD_BG = "#ffffff"
@@ -25,70 +28,61 @@ SYSTEM_BG = "#eef2fb"
 MODEL_PATHS = {
     "Orca-Mini-3B": "./models/orca-mini-3b.Q4_0.gguf",
     "Mistral-7B-Instruct": "./models/mistral-7b-instruct.Q4_K_M.gguf",
+    "LLaVA-1.5-7B": "./models/llava-v1.5-7b.Q4_K_M.gguf",
+}
+# Vision projectors for multimodal models; models listed here accept images.
+CLIP_PATHS = {
+    "LLaVA-1.5-7B": "./models/llava-v1.5-7b-mmproj-f16.gguf",
 }
+# Routes each turn to Orca-Mini-3B first and escalates to Mistral-7B when unsure
+AUTO_MODEL = "自动路由 (3B→7B)"
+ROUTE_LABELS = {"small": "3B", "escalated": "7B (3B 不确定, 已升级)", "large": "7B (难题直连)"}
+DEFAULT_MODEL = "Mistral-7B-Instruct"
+
+# ========== State ==========
+# Everything below is created in main(): importing this module (or running
+# --help / --list-models) never builds the window or loads a model.
+bot = None
+governor = None
+# Loaded bots keyed by model and config; the cascade reuses resident models
+registry = None
+store = None
+current_model = DEFAULT_MODEL
+session_id = None
+# Images waiting to be sent with the next message (multimodal models only)
+pending_images = []
+
+
+def _rss_mb():
+    import psutil
+
+    return psutil.Process().memory_info().rss / (1024 ** 2)
+
 
-root = tk.Tk()
-root.title("本地 LLaMA 聊天机器人")
-root.geometry("950x750")
-root.configure(bg=PRIMARY_BG)
-
-style = ttk.Style()
-style.theme_use("clam")
-style.configure("Background.TFrame", background=PRIMARY_BG)
-style.configure("Card.TFrame", background=CARD_BG)
-style.configure("Header.TLabel", background=PRIMARY_BG, foreground=TEXT_COLOR, font=("Arial", 18, "bold"))
-style.configure("SubHeader.TLabel", background=PRIMARY_BG, foreground=MUTED_TEXT, font=("Arial", 11))
-style.configure("SliderTitle.TLabel", background=CARD_BG, foreground=TEXT_COLOR, font=("Arial", 11, "bold"))
-style.configure("SliderValue.TLabel", background=CARD_BG, foreground=ACCENT_COLOR, font=("Arial", 11))
-style.configure("Accent.TButton", background=ACCENT_COLOR, foreground="white", font=("Arial", 12, "bold"), padding=(14, 8), borderwidth=0, focusthickness=0)
-style.map("Accent.TButton", background=[("active", ACCENT_HOVER), ("disabled", "#d8ddf7")], foreground=[("disabled", "#f1f4ff")])
-style.configure("Secondary.TButton", background="#e9ecf5", foreground=TEXT_COLOR, font=("Arial", 11), padding=(12, 6), borderwidth=0)
-style.map("Secondary.TButton", background=[("active", "#dde3f9"), ("disabled", "#f0f2f9")], foreground=[("disabled", "#9da3b5")])
-style.configure("TCombobox", fieldbackground=CARD_BG, background=CARD_BG, foreground=TEXT_COLOR, padding=6)
-style.map("TCombobox", fieldbackground=[("readonly", CARD_BG)], selectbackground=[("readonly", CARD_BG)])
-style.configure("Minimal.Vertical.TScrollbar", background="#c3c8d9", troughcolor=CARD_BG, bordercolor=CARD_BG, arrowcolor=MUTED_TEXT, gripcount=0)
-style.map("Minimal.Vertical.TScrollbar", background=[("active", "#b0b9d3")])
-style.configure("Metric.Horizontal.TScale", troughcolor="#d8dce7", background=ACCENT_COLOR)
-style.map("Metric.Horizontal.TScale", background=[("active", ACCENT_HOVER)])
-style.configure("Accent.Horizontal.TProgressbar", troughcolor=CARD_BG, background=ACCENT_COLOR)
-
-# Create first bot
-bot = ChatBot(MODEL_PATHS["Mistral-7B-Instruct"], system_prompt=SYSTEM_PROMPT)
-
-# Layout containers
-main_frame = ttk.Frame(root, style="Background.TFrame", padding=(24, 24, 24, 20))
-main_frame.grid(row=0, column=0, sticky="nsew")
-root.grid_rowconfigure(0, weight=1)
-root.grid_columnconfigure(0, weight=1)
-main_frame.grid_rowconfigure(1, weight=1)
-main_frame.grid_columnconfigure(0, weight=1)
-
-header_frame = ttk.Frame(main_frame, style="Background.TFrame")
-header_frame.grid(row=0, column=0, sticky="ew", pady=(0, 18))
-
-title_label = ttk.Label(header_frame, text="本地 LLaMA 聊天机器人", style="Header.TLabel")
-title_label.pack(anchor="w")
-subtitle_label = ttk.Label(
-    header_frame,
-    text="在本地实验对话模型 · 调整参数探索不同响应",
-    style="SubHeader.TLabel",
-)
-subtitle_label.pack(anchor="w", pady=(4, 0))
-
-chat_container = ttk.Frame(main_frame, style="Card.TFrame", padding=18)
-chat_container.grid(row=1, column=0, sticky="nsew")
-chat_container.grid_rowconfigure(0, weight=1)
-chat_container.grid_columnconfigure(0, weight=1)
-
-controls_container = ttk.Frame(main_frame, style="Background.TFrame", padding=(0, 18, 0, 0))
-controls_container.grid(row=2, column=0, sticky="ew")
-controls_container.grid_columnconfigure(0, weight=1)
+def _on_memory_event(event):
+    # Governor events may come from the worker thread; hand them to Tk.
+    root.after(0, lambda: append(f"[内存] {event.message}", "system"))
+
+
+def _session_model():
+    """Logged model id for the current selection (both files for the cascade)."""
+    if current_model == AUTO_MODEL:
+        return "+".join(model_key(MODEL_PATHS[name]) for name in ("Orca-Mini-3B", "Mistral-7B-Instruct"))
+    return model_key(MODEL_PATHS[current_model])
+
+
+def restart_session():
+    global session_id
+    if session_id is not None:
+        store.end_session(session_id)
+    session_id = store.start_session("gui", _session_model(), system_prompt=SYSTEM_PROMPT, meta={"label": current_model})
 
 def set_busy(is_busy: bool):
     entry.configure(state="disabled" if is_busy else "normal")
     if is_busy:
         send_button.state(["disabled"])
         clear_button.state(["disabled"])
+        attach_button.state(["disabled"])
         model_dropdown.configure(state="disabled")
         temperature_slider.state(["disabled"])
         top_p_slider.state(["disabled"])
@@ -98,6 +92,8 @@ def set_busy(is_busy: bool):
     else:
         send_button.state(["!disabled"])
         clear_button.state(["!disabled"])
+        if bot is not None and bot.supports_images:
+            attach_button.state(["!disabled"])
         model_dropdown.configure(state="readonly")
         temperature_slider.state(["!disabled"])
         top_p_slider.state(["!disabled"])
@@ -109,29 +105,77 @@ def do_send():
     user_input = entry.get("1.0", "end-1c").strip()
     if not user_input:
         return
+    if bot is None:
+        append("[系统] 模型尚未加载完成，请稍候。", "system")
+        return
     entry.delete("1.0", "end")
-    append(f"用户: {user_input}", "user")
+    images = list(pending_images)
+    pending_images.clear()
+    attachment_label.configure(text="")
+    if images:
+        names = "、".join(os.path.basename(p) for p in images)
+        append(f"用户: {user_input}\n[图片] {names}", "user")
+    else:
+        append(f"用户: {user_input}", "user")
     set_busy(True)
+    turn_start = tracing.now_us()
 
     def worker():
+        shifts = 0
+        decision = None
         try:
             reply, dt, mem = bot.chat(
                 user_input,
                 temperature=temperature_var.get(),
                 top_p=top_p_var.get(),
                 max_tokens=int(max_tokens_var.get()),
+                images=images or None,
             )
         except Exception as e:
             tb_str = traceback.format_exc()
             print(f"[Backend] Exception in chat: {tb_str}")
             reply = f"[系统错误] {e}"
             dt = 0.0
-            mem = PROCESS.memory_info().rss / (1024 ** 2)
+            mem = _rss_mb()
+        else:
+            shifts = bot.last_turn_shifts
+            decision = getattr(bot, "last_decision", None)
+            if decision is not None:
+                # Log the model that actually answered; the route goes in extra
+                answered = bot.small if decision.route == "small" else bot.large
+                model_path = answered.model_path
+            else:
+                model_path = bot.model_path
+            store.log_turn(
+                session_id,
+                user_input,
+                reply,
+                model=model_key(model_path),
+                latency=dt,
+                rss_mb=mem,
+                temperature=temperature_var.get(),
+                top_p=top_p_var.get(),
+                max_tokens=int(max_tokens_var.get()),
+                images=len(images),
+                context_shifts=shifts,
+                route=decision.route if decision else None,
+                route_label=ROUTE_LABELS[decision.route] if decision else None,
+                route_reason=decision.reason if decision else None,
+                route_saved_s=decision.saved_s if decision else None,
+            )
         finally:
             def done():
                 append(f"助手: {reply}", "assistant")
-                append(f"(延迟 {dt:.2f}s | 内存 {mem:.1f} MB)", "system")
+                metrics = f"延迟 {dt:.2f}s | 内存 {mem:.1f} MB"
+                if shifts:
+                    metrics += f" | 上下文滑动 {shifts} 次"
+                if decision is not None:
+                    metrics += f" | 路由 {ROUTE_LABELS[decision.route]}"
+                    if decision.route == "small":
+                        metrics += f" | 约节省 {decision.saved_s:.1f}s"
+                append(f"({metrics})", "system")
                 set_busy(False)
+                tracing.add_span("gui_turn", turn_start, tracing.now_us(), cat="gui")
             root.after(0, done)
 
     threading.Thread(target=worker, daemon=True).start()
@@ -141,21 +185,50 @@ def on_return(event):
     return "break"
 
 def do_clear():
-    bot.reset()
+    if bot is not None:
+        bot.reset()
+    restart_session()
     for w in chat_frame.winfo_children():
         w.destroy()
     append("[系统] 对话已清空。", "system")
 
+def do_attach():
+    paths = filedialog.askopenfilenames(
+        title="选择图片",
+        filetypes=[("Images", "*.png *.jpg *.jpeg *.webp *.bmp"), ("All files", "*.*")],
+    )
+    if not paths:
+        return
+    pending_images.extend(paths)
+    attachment_label.configure(text="已附加: " + "、".join(os.path.basename(p) for p in pending_images))
+
 def on_switch_model(event=None):
-    model_name = model_var.get()
-    new_path = MODEL_PATHS[model_name]
-    append(f"[系统] 正在切换到 {model_name}...", "system")
+    load_model(model_var.get())
+
+def load_model(model_name: str):
+    if bot is None:
+        append(f"[系统] 正在加载 {model_name}...", "system")
+    else:
+        append(f"[系统] 正在切换到 {model_name}...", "system")
     set_busy(True)
 
     def worker():
         global bot
         try:
-            new_bot = ChatBot(new_path, system_prompt=SYSTEM_PROMPT)
+            if model_name == AUTO_MODEL:
+                # Both models come from the shared registry; 7B loads on first escalation
+                new_bot = CascadeBot(
+                    MODEL_PATHS["Orca-Mini-3B"],
+                    MODEL_PATHS["Mistral-7B-Instruct"],
+                    system_prompt=SYSTEM_PROMPT,
+                    registry=registry,
+                )
+            else:
+                new_bot = registry.get(
+                    MODEL_PATHS[model_name],
+                    system_prompt=SYSTEM_PROMPT,
+                    clip_model_path=CLIP_PATHS.get(model_name),
+                )
         except Exception as err:
             tb_str = traceback.format_exc()
             print(f"[Backend] Failed to load model: {tb_str}")
@@ -168,8 +241,15 @@ def on_switch_model(event=None):
             return
 
         def done_success():
-            global bot
+            global bot, current_model
             bot = new_bot
+            bot.reset()  # a reused bot may still hold another session's history
+            current_model = model_name
+            restart_session()
+            # Free models the new selection does not use (they reload if picked again)
+            registry.release_except([bot.small, bot.large] if isinstance(bot, CascadeBot) else [bot])
+            pending_images.clear()
+            attachment_label.configure(text="")
             append(f"[系统] 模型 {model_name} 已加载完成。", "system")
             set_busy(False)
 
@@ -179,6 +259,10 @@ def on_switch_model(event=None):
 
 # ========== GUI Helpers ==========
 def add_bubble(text: str, sender: str):
+    with tracing.span("add_bubble", cat="gui", sender=sender, chars=len(text)):
+        _render_bubble(text, sender)
+
+def _render_bubble(text: str, sender: str):
     # sender in {"user","assistant","system"}
     auto_scroll = True
     try:
@@ -238,194 +322,281 @@ def append(text: str, tag: str = None):
     sender = tag if tag in {"user","assistant","system"} else "assistant"
     add_bubble(text, sender)
 
-# Chat area: Canvas + inner Frame + Scrollbar (for bubble layout)
-chat_canvas = tk.Canvas(
-    chat_container,
-    highlightthickness=0,
-    bd=0,
-    relief="flat",
-    background=CARD_BG,
-)
-chat_scrollbar = ttk.Scrollbar(
-    chat_container,
-    orient="vertical",
-    command=chat_canvas.yview,
-    style="Minimal.Vertical.TScrollbar",
-)
-chat_frame = tk.Frame(chat_canvas, bg=CARD_BG)
-
-# attach frame to canvas
-chat_window = chat_canvas.create_window((0, 0), window=chat_frame, anchor="nw")
-chat_canvas.configure(yscrollcommand=chat_scrollbar.set)
-chat_scrollbar.config(command=chat_canvas.yview)
-
-def _on_frame_config(event=None):
-    chat_canvas.configure(scrollregion=chat_canvas.bbox("all"))
-
-chat_frame.bind("<Configure>", _on_frame_config)
-
-def _on_canvas_config(event):
-    chat_canvas.itemconfig(chat_window, width=event.width)
-
-chat_canvas.bind("<Configure>", _on_canvas_config)
-
-# mouse wheel scroll with enable/disable on enter/leave
-def _on_mousewheel(event):
-    if event.delta:
-        if abs(event.delta) < 120:
-            step = -1 if event.delta > 0 else 1
-        else:
-            step = int(-event.delta / 120)
+# ========== Window ==========
+def build_ui(initial_model: str):
+    global root, chat_canvas, chat_frame, entry, send_button, clear_button, attach_button, attachment_label
+    global model_var, model_dropdown, progress_bar, temperature_var, top_p_var, max_tokens_var
+    global temperature_slider, top_p_slider, max_tokens_slider
+
+    root = tk.Tk()
+    root.title("本地 LLaMA 聊天机器人")
+    root.geometry("950x750")
+    root.configure(bg=PRIMARY_BG)
+
+    style = ttk.Style()
+    style.theme_use("clam")
+    style.configure("Background.TFrame", background=PRIMARY_BG)
+    style.configure("Card.TFrame", background=CARD_BG)
+    style.configure("Header.TLabel", background=PRIMARY_BG, foreground=TEXT_COLOR, font=("Arial", 18, "bold"))
+    style.configure("SubHeader.TLabel", background=PRIMARY_BG, foreground=MUTED_TEXT, font=("Arial", 11))
+    style.configure("SliderTitle.TLabel", background=CARD_BG, foreground=TEXT_COLOR, font=("Arial", 11, "bold"))
+    style.configure("SliderValue.TLabel", background=CARD_BG, foreground=ACCENT_COLOR, font=("Arial", 11))
+    style.configure("Accent.TButton", background=ACCENT_COLOR, foreground="white", font=("Arial", 12, "bold"), padding=(14, 8), borderwidth=0, focusthickness=0)
+    style.map("Accent.TButton", background=[("active", ACCENT_HOVER), ("disabled", "#d8ddf7")], foreground=[("disabled", "#f1f4ff")])
+    style.configure("Secondary.TButton", background="#e9ecf5", foreground=TEXT_COLOR, font=("Arial", 11), padding=(12, 6), borderwidth=0)
+    style.map("Secondary.TButton", background=[("active", "#dde3f9"), ("disabled", "#f0f2f9")], foreground=[("disabled", "#9da3b5")])
+    style.configure("TCombobox", fieldbackground=CARD_BG, background=CARD_BG, foreground=TEXT_COLOR, padding=6)
+    style.map("TCombobox", fieldbackground=[("readonly", CARD_BG)], selectbackground=[("readonly", CARD_BG)])
+    style.configure("Minimal.Vertical.TScrollbar", background="#c3c8d9", troughcolor=CARD_BG, bordercolor=CARD_BG, arrowcolor=MUTED_TEXT, gripcount=0)
+    style.map("Minimal.Vertical.TScrollbar", background=[("active", "#b0b9d3")])
+    style.configure("Metric.Horizontal.TScale", troughcolor="#d8dce7", background=ACCENT_COLOR)
+    style.map("Metric.Horizontal.TScale", background=[("active", ACCENT_HOVER)])
+    style.configure("Accent.Horizontal.TProgressbar", troughcolor=CARD_BG, background=ACCENT_COLOR)
+
+    # Layout containers
+    main_frame = ttk.Frame(root, style="Background.TFrame", padding=(24, 24, 24, 20))
+    main_frame.grid(row=0, column=0, sticky="nsew")
+    root.grid_rowconfigure(0, weight=1)
+    root.grid_columnconfigure(0, weight=1)
+    main_frame.grid_rowconfigure(1, weight=1)
+    main_frame.grid_columnconfigure(0, weight=1)
+
+    header_frame = ttk.Frame(main_frame, style="Background.TFrame")
+    header_frame.grid(row=0, column=0, sticky="ew", pady=(0, 18))
+
+    title_label = ttk.Label(header_frame, text="本地 LLaMA 聊天机器人", style="Header.TLabel")
+    title_label.pack(anchor="w")
+    subtitle_label = ttk.Label(
+        header_frame,
+        text="在本地实验对话模型 · 调整参数探索不同响应",
+        style="SubHeader.TLabel",
+    )
+    subtitle_label.pack(anchor="w", pady=(4, 0))
+
+    chat_container = ttk.Frame(main_frame, style="Card.TFrame", padding=18)
+    chat_container.grid(row=1, column=0, sticky="nsew")
+    chat_container.grid_rowconfigure(0, weight=1)
+    chat_container.grid_columnconfigure(0, weight=1)
+
+    controls_container = ttk.Frame(main_frame, style="Background.TFrame", padding=(0, 18, 0, 0))
+    controls_container.grid(row=2, column=0, sticky="ew")
+    controls_container.grid_columnconfigure(0, weight=1)
+
+    # Chat area: Canvas + inner Frame + Scrollbar (for bubble layout)
+    chat_canvas = tk.Canvas(
+        chat_container,
+        highlightthickness=0,
+        bd=0,
+        relief="flat",
+        background=CARD_BG,
+    )
+    chat_scrollbar = ttk.Scrollbar(
+        chat_container,
+        orient="vertical",
+        command=chat_canvas.yview,
+        style="Minimal.Vertical.TScrollbar",
+    )
+    chat_frame = tk.Frame(chat_canvas, bg=CARD_BG)
+
+    # attach frame to canvas
+    chat_window = chat_canvas.create_window((0, 0), window=chat_frame, anchor="nw")
+    chat_canvas.configure(yscrollcommand=chat_scrollbar.set)
+    chat_scrollbar.config(command=chat_canvas.yview)
+
+    def _on_frame_config(event=None):
+        chat_canvas.configure(scrollregion=chat_canvas.bbox("all"))
+
+    chat_frame.bind("<Configure>", _on_frame_config)
+
+    def _on_canvas_config(event):
+        chat_canvas.itemconfig(chat_window, width=event.width)
+
+    chat_canvas.bind("<Configure>", _on_canvas_config)
+
+    # mouse wheel scroll with enable/disable on enter/leave
+    def _on_mousewheel(event):
+        if event.delta:
+            if abs(event.delta) < 120:
+                step = -1 if event.delta > 0 else 1
+            else:
+                step = int(-event.delta / 120)
+            chat_canvas.yview_scroll(step, "units")
+
+    def _on_linux_scroll(event):
+        step = -1 if event.num == 4 else 1
         chat_canvas.yview_scroll(step, "units")
 
+    def _bind_mousewheel(event):
+        chat_canvas.bind_all("<MouseWheel>", _on_mousewheel)
+        chat_canvas.bind_all("<Button-4>", _on_linux_scroll)
+        chat_canvas.bind_all("<Button-5>", _on_linux_scroll)
+
+    def _unbind_mousewheel(event):
+        chat_canvas.unbind_all("<MouseWheel>")
+        chat_canvas.unbind_all("<Button-4>")
+        chat_canvas.unbind_all("<Button-5>")
+
+    chat_canvas.bind("<Enter>", _bind_mousewheel)
+    chat_canvas.bind("<Leave>", _unbind_mousewheel)
+
+    chat_canvas.grid(row=0, column=0, sticky="nsew")
+    chat_scrollbar.grid(row=0, column=1, padx=(12, 0), sticky="ns")
 
-def _on_linux_scroll(event):
-    step = -1 if event.num == 4 else 1
-    chat_canvas.yview_scroll(step, "units")
-
-
-def _bind_mousewheel(event):
-    chat_canvas.bind_all("<MouseWheel>", _on_mousewheel)
-    chat_canvas.bind_all("<Button-4>", _on_linux_scroll)
-    chat_canvas.bind_all("<Button-5>", _on_linux_scroll)
-
-
-def _unbind_mousewheel(event):
-    chat_canvas.unbind_all("<MouseWheel>")
-    chat_canvas.unbind_all("<Button-4>")
-    chat_canvas.unbind_all("<Button-5>")
-
-
-chat_canvas.bind("<Enter>", _bind_mousewheel)
-chat_canvas.bind("<Leave>", _unbind_mousewheel)
-
-chat_canvas.grid(row=0, column=0, sticky="nsew")
-chat_scrollbar.grid(row=0, column=1, padx=(12, 0), sticky="ns")
-
-# Input card with message box and actions
-input_card = ttk.Frame(controls_container, style="Card.TFrame", padding=(16, 14))
-input_card.grid(row=0, column=0, sticky="ew")
-input_card.grid_columnconfigure(0, weight=1)
-
-entry = tk.Text(
-    input_card,
-    font=("Arial", 12),
-    height=3,
-    wrap="word",
-    relief="flat",
-    bd=0,
-    highlightthickness=0,
-)
-entry.configure(bg=CARD_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
-entry.grid(row=0, column=0, rowspan=2, padx=(0, 16), sticky="nsew")
-entry.bind("<Return>", on_return)            # Enter 发送
-entry.bind("<Shift-Return>", lambda e: entry.insert("insert", "\n"))  # Shift+Enter 换行
-
-send_button = ttk.Button(input_card, text="发送", command=do_send, style="Accent.TButton")
-send_button.grid(row=0, column=1, sticky="ew")
-
-clear_button = ttk.Button(input_card, text="清空", command=do_clear, style="Secondary.TButton")
-clear_button.grid(row=1, column=1, sticky="ew", pady=(8, 0))
-
-# Model selector row
-model_row = ttk.Frame(controls_container, style="Background.TFrame")
-model_row.grid(row=1, column=0, sticky="ew", pady=(16, 0))
-model_row.grid_columnconfigure(0, weight=1)
-
-model_var = tk.StringVar(value="Mistral-7B-Instruct")
-model_dropdown = ttk.Combobox(
-    model_row,
-    textvariable=model_var,
-    values=["Orca-Mini-3B", "Mistral-7B-Instruct"],
-    state="readonly",
-)
-model_dropdown.bind("<<ComboboxSelected>>", on_switch_model)
-model_dropdown.grid(row=0, column=0, sticky="ew")
-
-progress_bar = ttk.Progressbar(
-    model_row,
-    mode="indeterminate",
-    style="Accent.Horizontal.TProgressbar",
-    length=160,
-)
-progress_bar.grid(row=0, column=1, padx=(16, 0))
-progress_bar.grid_remove()
-
-# Slider card for parameters
-slider_card = ttk.Frame(controls_container, style="Card.TFrame", padding=(16, 14))
-slider_card.grid(row=2, column=0, sticky="ew", pady=(16, 0))
-slider_card.grid_columnconfigure(0, weight=1, uniform="slider")
-slider_card.grid_columnconfigure(1, weight=1, uniform="slider")
-slider_card.grid_columnconfigure(2, weight=1, uniform="slider")
-
-temperature_var = tk.DoubleVar(value=0.8)
-top_p_var = tk.DoubleVar(value=0.95)
-max_tokens_var = tk.DoubleVar(value=512)
-
-
-def _build_slider(parent, column, title, variable, minimum, maximum, formatter):
-    container = ttk.Frame(parent, style="Card.TFrame")
-    container.grid(row=0, column=column, sticky="ew", padx=4)
-    container.grid_columnconfigure(0, weight=1)
-    container.grid_columnconfigure(1, weight=0)
-
-    title_label = ttk.Label(container, text=title, style="SliderTitle.TLabel")
-    title_label.grid(row=0, column=0, sticky="w")
-
-    value_label = ttk.Label(container, text=formatter(variable.get()), style="SliderValue.TLabel")
-    value_label.grid(row=0, column=1, sticky="e")
-
-    scale = ttk.Scale(
-        container,
-        variable=variable,
-        from_=minimum,
-        to=maximum,
-        orient="horizontal",
-        style="Metric.Horizontal.TScale",
+    # Input card with message box and actions
+    input_card = ttk.Frame(controls_container, style="Card.TFrame", padding=(16, 14))
+    input_card.grid(row=0, column=0, sticky="ew")
+    input_card.grid_columnconfigure(0, weight=1)
+
+    entry = tk.Text(
+        input_card,
+        font=("Arial", 12),
+        height=3,
+        wrap="word",
+        relief="flat",
+        bd=0,
+        highlightthickness=0,
+    )
+    entry.configure(bg=CARD_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+    entry.grid(row=0, column=0, rowspan=2, padx=(0, 16), sticky="nsew")
+    entry.bind("<Return>", on_return)            # Enter 发送
+    entry.bind("<Shift-Return>", lambda e: entry.insert("insert", "\n"))  # Shift+Enter 换行
+
+    send_button = ttk.Button(input_card, text="发送", command=do_send, style="Accent.TButton")
+    send_button.grid(row=0, column=1, sticky="ew")
+
+    clear_button = ttk.Button(input_card, text="清空", command=do_clear, style="Secondary.TButton")
+    clear_button.grid(row=1, column=1, sticky="ew", pady=(8, 0))
+
+    attach_button = ttk.Button(input_card, text="图片", command=do_attach, style="Secondary.TButton")
+    attach_button.grid(row=2, column=1, sticky="ew", pady=(8, 0))
+    attach_button.state(["disabled"])
+    attachment_label = tk.Label(input_card, text="", bg=CARD_BG, fg=MUTED_TEXT, font=("Arial", 10), anchor="w")
+    attachment_label.grid(row=2, column=0, sticky="ew", padx=(0, 16), pady=(8, 0))
+
+    # Model selector row
+    model_row = ttk.Frame(controls_container, style="Background.TFrame")
+    model_row.grid(row=1, column=0, sticky="ew", pady=(16, 0))
+    model_row.grid_columnconfigure(0, weight=1)
+
+    model_var = tk.StringVar(value=initial_model)
+    model_dropdown = ttk.Combobox(
+        model_row,
+        textvariable=model_var,
+        values=list(MODEL_PATHS) + [AUTO_MODEL],
+        state="readonly",
+    )
+    model_dropdown.bind("<<ComboboxSelected>>", on_switch_model)
+    model_dropdown.grid(row=0, column=0, sticky="ew")
+
+    progress_bar = ttk.Progressbar(
+        model_row,
+        mode="indeterminate",
+        style="Accent.Horizontal.TProgressbar",
+        length=160,
+    )
+    progress_bar.grid(row=0, column=1, padx=(16, 0))
+    progress_bar.grid_remove()
+
+    # Slider card for parameters
+    slider_card = ttk.Frame(controls_container, style="Card.TFrame", padding=(16, 14))
+    slider_card.grid(row=2, column=0, sticky="ew", pady=(16, 0))
+    slider_card.grid_columnconfigure(0, weight=1, uniform="slider")
+    slider_card.grid_columnconfigure(1, weight=1, uniform="slider")
+    slider_card.grid_columnconfigure(2, weight=1, uniform="slider")
+
+    temperature_var = tk.DoubleVar(value=0.8)
+    top_p_var = tk.DoubleVar(value=0.95)
+    max_tokens_var = tk.DoubleVar(value=512)
+
+    def _build_slider(parent, column, title, variable, minimum, maximum, formatter):
+        container = ttk.Frame(parent, style="Card.TFrame")
+        container.grid(row=0, column=column, sticky="ew", padx=4)
+        container.grid_columnconfigure(0, weight=1)
+        container.grid_columnconfigure(1, weight=0)
+
+        title_label = ttk.Label(container, text=title, style="SliderTitle.TLabel")
+        title_label.grid(row=0, column=0, sticky="w")
+
+        value_label = ttk.Label(container, text=formatter(variable.get()), style="SliderValue.TLabel")
+        value_label.grid(row=0, column=1, sticky="e")
+
+        scale = ttk.Scale(
+            container,
+            variable=variable,
+            from_=minimum,
+            to=maximum,
+            orient="horizontal",
+            style="Metric.Horizontal.TScale",
+        )
+
+        def _update(value):
+            try:
+                numeric = float(value)
+            except (TypeError, ValueError):
+                numeric = variable.get()
+            value_label.configure(text=formatter(numeric))
+
+        scale.configure(command=_update)
+        scale.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(8, 0))
+        return scale
+
+    temperature_slider = _build_slider(
+        slider_card,
+        0,
+        "Temperature",
+        temperature_var,
+        0.0,
+        2.0,
+        lambda v: f"{float(v):.2f}",
     )
 
-    def _update(value):
-        try:
-            numeric = float(value)
-        except (TypeError, ValueError):
-            numeric = variable.get()
-        value_label.configure(text=formatter(numeric))
-
-    scale.configure(command=_update)
-    scale.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(8, 0))
-    return scale
-
-
-temperature_slider = _build_slider(
-    slider_card,
-    0,
-    "Temperature",
-    temperature_var,
-    0.0,
-    2.0,
-    lambda v: f"{float(v):.2f}",
-)
-
-top_p_slider = _build_slider(
-    slider_card,
-    1,
-    "Top-p",
-    top_p_var,
-    0.0,
-    1.0,
-    lambda v: f"{float(v):.2f}",
-)
-
-max_tokens_slider = _build_slider(
-    slider_card,
-    2,
-    "Max Tokens",
-    max_tokens_var,
-    1,
-    2048,
-    lambda v: str(int(float(v))),
-)
-
-append("[系统] 界面已就绪。按 Enter 发送消息；下拉框可切换模型。", "system")
-
-root.mainloop()
+    top_p_slider = _build_slider(
+        slider_card,
+        1,
+        "Top-p",
+        top_p_var,
+        0.0,
+        1.0,
+        lambda v: f"{float(v):.2f}",
+    )
+
+    max_tokens_slider = _build_slider(
+        slider_card,
+        2,
+        "Max Tokens",
+        max_tokens_var,
+        1,
+        2048,
+        lambda v: str(int(float(v))),
+    )
+
+
+def main(argv=None):
+    global governor, registry, store, current_model
+    ap = argparse.ArgumentParser(description="本地 LLaMA 聊天机器人 (Tk)")
+    ap.add_argument("--model", choices=list(MODEL_PATHS) + ["auto"], default=DEFAULT_MODEL, help="model loaded at startup")
+    ap.add_argument("--list-models", action="store_true", help="print the known models and exit")
+    args = ap.parse_args(argv)
+    if args.list_models:
+        for name, path in MODEL_PATHS.items():
+            status = "ok" if os.path.exists(path) else "missing"
+            extra = ", images" if name in CLIP_PATHS else ""
+            print(f"{name:<22} {path} ({status}{extra})")
+        print(f"{'auto':<22} {AUTO_MODEL}: Orca-Mini-3B first, Mistral-7B when unsure")
+        return
+
+    initial_model = AUTO_MODEL if args.model == "auto" else args.model
+    build_ui(initial_model)
+    governor = MemoryGovernor(on_event=_on_memory_event)
+    registry = BotRegistry(governor)
+    # Transcripts are written by the store's background thread
+    store = TranscriptStore()
+    current_model = initial_model
+    append("[系统] 界面已就绪。按 Enter 发送消息；下拉框可切换模型。", "system")
+    # Show the window first and load the model in the background
+    root.after(0, lambda: load_model(initial_model))
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
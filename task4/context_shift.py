@@ -0,0 +1,164 @@
+"""``Llama`` subclass that slides the KV cache instead of failing at ``n_ctx``.
+
+When an eval would overflow the context window, the oldest tokens after the
+first ``n_keep`` (BOS + system prompt) are removed from the KV cache and the
+remaining cells are shifted back by the same amount, the way llama.cpp's own
+``main`` example does it.  Generation then continues without re-prefilling, so
+each further token costs the same as before.
+
+``Llama.create_completion`` rejects prompts that do not fit and silently cuts
+``max_tokens`` down to whatever room is left.  The override below trims
+over-long prompts the same way, and when a reply stops only because the
+window is full it shifts and keeps generating until ``max_tokens`` is met.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+from llama_cpp import Llama
+
+
+class ShiftingLlama(Llama):
+    """Drop-in ``Llama`` with context shifting on overflow."""
+
+    def __init__(
+        self,
+        *args,
+        n_keep: int = 0,
+        n_discard: Optional[int] = None,
+        on_shift: Optional[Callable[[int, int], None]] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.n_keep = n_keep
+        # Tokens dropped per shift; default is half of what is not kept.
+        self.n_discard = n_discard
+        self.on_shift = on_shift
+        self.shift_count = 0
+        self._last_sampled: Optional[int] = None
+
+    def _record_shift(self, n_keep: int, n_discard: int) -> None:
+        self.shift_count += 1
+        if self.on_shift is not None:
+            self.on_shift(n_keep, n_discard)
+
+    def shift_context(self, needed: int) -> int:
+        """Free at least ``needed`` cells; returns how many tokens were dropped."""
+        n_past = self.n_tokens
+        n_keep = min(max(self.n_keep, 0), n_past)
+        n_left = n_past - n_keep
+        if n_left < needed:
+            raise ValueError(
+                f"Cannot shift context: {needed} cells needed but only {n_left} tokens after n_keep={n_keep}"
+            )
+        n_discard = self.n_discard if self.n_discard else n_left // 2
+        n_discard = min(max(n_discard, needed), n_left)
+
+        self._ctx.kv_cache_seq_rm(0, n_keep, n_keep + n_discard)
+        self._ctx.kv_cache_seq_shift(0, n_keep + n_discard, n_past, -n_discard)
+        self.input_ids[n_keep : n_past - n_discard] = self.input_ids[n_keep + n_discard : n_past]
+        if self.context_params.logits_all:
+            self.scores[n_keep : n_past - n_discard, :] = self.scores[n_keep + n_discard : n_past, :]
+        self.n_tokens = n_past - n_discard
+        self._record_shift(n_keep, n_discard)
+        return n_discard
+
+    def eval(self, tokens: Sequence[int]) -> None:
+        overflow = self.n_tokens + len(tokens) - self.n_ctx()
+        if overflow > 0:
+            self.shift_context(overflow)
+        super().eval(tokens)
+
+    # ------------------------------------------------------------------
+    # Completion
+    # ------------------------------------------------------------------
+    def _prompt_tokens(self, prompt: Union[str, List[int]]) -> List[int]:
+        if isinstance(prompt, str):
+            if not prompt:
+                return [self.token_bos()]
+            return self.tokenize(prompt.encode("utf-8"), special=True)
+        return list(prompt)
+
+    def _fit_prompt(self, tokens: List[int], room: int) -> List[int]:
+        """Drop the oldest tokens after ``n_keep`` so ``room`` cells stay free."""
+        limit = self.n_ctx() - room
+        if len(tokens) <= limit:
+            return tokens
+        if any(token < 0 for token in tokens):
+            # Image positions (-1) cannot be re-evaluated from ids; the caller
+            # has to drop whole turns instead.
+            return tokens
+        n_keep = min(max(self.n_keep, 0), limit // 2)
+        self._record_shift(n_keep, len(tokens) - limit)
+        return tokens[:n_keep] + tokens[len(tokens) - (limit - n_keep) :]
+
+    def _window_full(self) -> bool:
+        # ``generate`` does not eval the last sampled token, hence the -1.
+        return self.n_tokens >= self.n_ctx() - 1
+
+    def generate(self, tokens: Sequence[int], **kwargs: Any) -> Iterator[int]:
+        self._last_sampled = None
+        for token in super().generate(tokens, **kwargs):
+            self._last_sampled = token
+            yield token
+
+    def _continuation(self) -> List[int]:
+        self.shift_context(2)
+        tokens = self.input_ids[: self.n_tokens].tolist()
+        # The final sampled token was returned but never evaluated; without it
+        # the next call would sample that position a second time.
+        if self._last_sampled is not None:
+            tokens.append(self._last_sampled)
+        return tokens
+
+    def create_completion(self, prompt: Union[str, List[int]], **kwargs: Any):
+        max_tokens = kwargs.get("max_tokens", 16)
+        budget = int(max_tokens) if max_tokens is not None and max_tokens > 0 else None
+        tokens = self._prompt_tokens(prompt)
+        tokens = self._fit_prompt(tokens, min(budget or self.n_ctx(), self.n_ctx() // 4))
+        if budget is None or len(tokens) + budget < self.n_ctx():
+            return super().create_completion(tokens, **kwargs)
+        if kwargs.get("stream"):
+            return self._stream_shifting(tokens, budget, kwargs)
+        return self._complete_shifting(tokens, budget, kwargs)
+
+    def _complete_shifting(self, tokens: List[int], budget: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        merged: Optional[Dict[str, Any]] = None
+        while True:
+            output = super().create_completion(tokens, **dict(kwargs, max_tokens=budget))
+            choice = output["choices"][0]
+            produced = output["usage"]["completion_tokens"]
+            if merged is None:
+                merged = output
+            else:
+                merged["choices"][0]["text"] += choice["text"]
+                merged["choices"][0]["finish_reason"] = choice["finish_reason"]
+                merged["usage"]["completion_tokens"] += produced
+                merged["usage"]["total_tokens"] += produced
+            budget -= produced
+            if choice["finish_reason"] != "length" or budget <= 0 or produced == 0 or not self._window_full():
+                return merged
+            tokens = self._continuation()
+            kwargs = dict(kwargs, echo=False)
+
+    def _stream_shifting(self, tokens: List[int], budget: int, kwargs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        while True:
+            last: Optional[Dict[str, Any]] = None
+            for chunk in super().create_completion(tokens, **dict(kwargs, max_tokens=budget)):
+                if chunk["choices"][0].get("finish_reason") is not None:
+                    last = chunk  # held back until we know whether we continue
+                    continue
+                yield chunk
+            produced = max(self.n_tokens + 1 - len(tokens), 0)
+            budget -= produced
+            finish = last["choices"][0]["finish_reason"] if last is not None else None
+            if finish != "length" or budget <= 0 or produced == 0 or not self._window_full():
+                if last is not None:
+                    yield last
+                return
+            if last is not None and last["choices"][0].get("text"):
+                last["choices"][0]["finish_reason"] = None
+                yield last
+            tokens = self._continuation()
+            kwargs = dict(kwargs, echo=False)
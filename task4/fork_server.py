@@ -0,0 +1,372 @@
+"""Fork-server that shares one loaded model with many worker processes.
+
+The parent builds a ``ChatBot`` once (llama.cpp memory-maps the GGUF weights),
+pre-faults the weight pages, then ``fork()``s workers.  Children inherit the
+mapping copy-on-write, so a worker is ready in milliseconds and N workers cost
+roughly one copy of the weights plus N private KV caches instead of N full
+loads.  Workers are pinged periodically and recycled when they die, stop
+answering, exceed a request budget or grow past an RSS limit.
+
+POSIX only (relies on ``os.fork``), CPU only: forking after a CUDA/Metal
+backend has been initialised is unsafe, so ``n_gpu_layers`` must be 0.
+
+Replacements are forked from whichever thread notices the problem: a request
+thread, or the health monitor thread.  That is safe here only because the
+parent never runs inference (no llama.cpp compute threads exist), and a child
+touches nothing but its own pipe and the inherited model.  Do not add parent
+work that holds native locks (inference, GPU calls) while a ``ForkServer`` is
+running, or set ``health_interval=0`` and call ``health_check`` from the
+thread that owns the server.
+"""
+
+from __future__ import annotations
+
+import itertools
+import mmap
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from chat_backend import ChatBot
+from memory_governor import MB
+
+if TYPE_CHECKING:
+    import psutil
+
+
+class WorkerError(RuntimeError):
+    """Raised when a request could not be served by any healthy worker."""
+
+
+@dataclass(eq=False)
+class Worker:
+    pid: int
+    conn: Connection
+    started: float = field(default_factory=time.monotonic)
+    served: int = 0
+    last_rss_mb: float = 0.0
+    last_pss_mb: float = 0.0
+    fork_ms: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def _memory_mb(process: psutil.Process) -> Dict[str, float]:
+    import psutil
+
+    try:
+        info = process.memory_full_info()
+        pss = getattr(info, "pss", info.uss)
+        return {"rss_mb": info.rss / MB, "pss_mb": pss / MB, "uss_mb": info.uss / MB}
+    except (psutil.AccessDenied, AttributeError):
+        rss = process.memory_info().rss / MB
+        return {"rss_mb": rss, "pss_mb": rss, "uss_mb": rss}
+
+
+def _prefault(path: str, chunk: int = 64 * MB) -> None:
+    """Pull the model file into the page cache so forked workers start warm."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                mapped.madvise(mmap.MADV_WILLNEED)
+            page = mmap.PAGESIZE
+            for offset in range(0, len(mapped), chunk):
+                # Touch one byte per page; reading is enough to fault it in.
+                end = min(offset + chunk, len(mapped))
+                _ = mapped[offset:end:page]
+
+
+class ForkServer:
+    """Pre-loaded model parent that forks, health-checks and recycles workers."""
+
+    def __init__(
+        self,
+        model_path: str,
+        *,
+        n_workers: int = 2,
+        max_requests: int = 200,
+        max_rss_mb: Optional[float] = None,
+        request_timeout: float = 300.0,
+        health_interval: float = 5.0,
+        health_timeout: float = 2.0,
+        **bot_kwargs: Any,
+    ) -> None:
+        if not hasattr(os, "fork"):
+            raise OSError("ForkServer needs os.fork (Linux/macOS)")
+        # ChatBot defaults to n_gpu_layers=20; a GPU backend must not be forked.
+        if bot_kwargs.setdefault("n_gpu_layers", 0) > 0:
+            raise ValueError("ForkServer is CPU only; n_gpu_layers must be 0")
+        self.model_path = model_path
+        self.n_workers = max(n_workers, 1)
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.recycled = 0
+        self._workers: List[Worker] = []
+        self._lock = threading.RLock()
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+        load_start = time.perf_counter()
+        # Only load in the parent; no inference here. llama.cpp's OpenMP
+        # thread pool is not fork-safe once it has been started, so each child
+        # runs its first eval itself.
+        self.bot = ChatBot(model_path, **bot_kwargs)
+        _prefault(model_path)
+        self.load_seconds = time.perf_counter() - load_start
+
+    # ------------------------------------------------------------------
+    # Worker lifecycle
+    # ------------------------------------------------------------------
+    def _spawn(self) -> Worker:
+        parent_conn, child_conn = Pipe()
+        fork_start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:  # child
+            code = 0
+            try:
+                parent_conn.close()
+                for other in self._workers:
+                    other.conn.close()
+                self._worker_loop(child_conn)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)  # skip the parent's atexit handlers
+        child_conn.close()
+        return Worker(pid, parent_conn, fork_ms=(time.perf_counter() - fork_start) * 1000)
+
+    def _worker_loop(self, conn: Connection) -> None:
+        import psutil
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+        process = psutil.Process()
+        bot = self.bot
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            kind = message.get("kind")
+            if kind == "stop":
+                return
+            if kind == "ping":
+                conn.send(dict(ok=True, pid=os.getpid(), **_memory_mb(process)))
+                continue
+            try:
+                if kind == "chat":
+                    bot.messages = message.get("history") or [{"role": "system", "content": bot.system_prompt}]
+                    reply, elapsed, _ = bot.chat(message["user"], **message.get("params", {}))
+                    result = {"reply": reply, "elapsed": elapsed, "history": bot.messages}
+                elif kind == "complete":
+                    text, elapsed = bot.complete(message["prompt"], **message.get("params", {}))
+                    result = {"reply": text, "elapsed": elapsed}
+                else:
+                    raise ValueError(f"Unknown request kind: {kind}")
+                conn.send(dict(ok=True, pid=os.getpid(), **result, **_memory_mb(process)))
+            except Exception as exc:
+                conn.send({"ok": False, "pid": os.getpid(), "error": str(exc)})
+
+    def _retire(self, worker: Worker, *, kill: bool) -> None:
+        try:
+            if kill:
+                os.kill(worker.pid, signal.SIGKILL)
+            else:
+                worker.conn.send({"kind": "stop"})
+        except (OSError, BrokenPipeError):
+            pass
+        worker.conn.close()
+        try:
+            os.waitpid(worker.pid, 0)
+        except ChildProcessError:
+            pass
+
+    def _replace(self, worker: Worker, *, kill: bool) -> Optional[Worker]:
+        with self._lock:
+            if worker not in self._workers:
+                return None  # already retired and reaped by someone else
+            index = self._workers.index(worker)
+            self._retire(worker, kill=kill)
+            fresh = self._spawn()
+            self._workers[index] = fresh
+            self.recycled += 1
+            return fresh
+
+    @staticmethod
+    def _alive(worker: Worker) -> bool:
+        try:
+            pid, _ = os.waitpid(worker.pid, os.WNOHANG)
+        except ChildProcessError:
+            return False
+        return pid == 0
+
+    def start(self) -> "ForkServer":
+        with self._lock:
+            while len(self._workers) < self.n_workers:
+                self._workers.append(self._spawn())
+        if self.health_interval > 0 and self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, name="fork-server-health", daemon=True)
+            self._monitor.start()
+        return self
+
+    def _monitor_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            self.health_check()
+
+    def health_check(self) -> List[Dict[str, Any]]:
+        """Ping idle workers; recycle dead, silent or oversized ones."""
+        report = []
+        for worker in list(self._workers):
+            if not worker.lock.acquire(blocking=False):
+                report.append({"pid": worker.pid, "status": "busy"})
+                continue
+            try:
+                status = "ok"
+                if not self._alive(worker):
+                    status = "dead"
+                else:
+                    try:
+                        worker.conn.send({"kind": "ping"})
+                        if worker.conn.poll(self.health_timeout):
+                            pong = worker.conn.recv()
+                            worker.last_rss_mb = pong["rss_mb"]
+                            worker.last_pss_mb = pong["pss_mb"]
+                            if self.max_rss_mb is not None and worker.last_rss_mb > self.max_rss_mb:
+                                status = "oversized"
+                        else:
+                            status = "unresponsive"
+                    except (EOFError, OSError):
+                        status = "dead"
+                report.append({"pid": worker.pid, "status": status, "rss_mb": worker.last_rss_mb, "pss_mb": worker.last_pss_mb})
+                if status != "ok":
+                    self._replace(worker, kill=status != "oversized")
+            finally:
+                worker.lock.release()
+        return report
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+    def _current(self, worker: Worker) -> bool:
+        with self._lock:
+            return worker in self._workers
+
+    def _pick(self) -> Worker:
+        while True:
+            with self._lock:
+                workers = list(self._workers)
+            if not workers:
+                raise WorkerError("ForkServer has no workers; call start() first")
+            offset = next(self._rr)
+            for i in range(len(workers)):
+                worker = workers[(offset + i) % len(workers)]
+                if worker.lock.acquire(blocking=False):
+                    if self._current(worker):
+                        return worker
+                    worker.lock.release()
+            worker = workers[offset % len(workers)]
+            worker.lock.acquire()
+            # It may have been recycled while we waited; pick again if so.
+            if self._current(worker):
+                return worker
+            worker.lock.release()
+
+    def request(self, message: Dict[str, Any], *, retries: int = 1) -> Dict[str, Any]:
+        for _ in range(retries + 1):
+            worker = self._pick()
+            try:
+                try:
+                    worker.conn.send(message)
+                    if not worker.conn.poll(self.request_timeout):
+                        raise TimeoutError(f"worker {worker.pid} timed out")
+                    response = worker.conn.recv()
+                except (EOFError, OSError, TimeoutError):
+                    self._replace(worker, kill=True)
+                    continue
+                worker.served += 1
+                worker.last_rss_mb = response.get("rss_mb", worker.last_rss_mb)
+                worker.last_pss_mb = response.get("pss_mb", worker.last_pss_mb)
+                if worker.served >= self.max_requests:
+                    self._replace(worker, kill=False)
+                return response
+            finally:
+                worker.lock.release()
+        raise WorkerError("No healthy worker could serve the request")
+
+    def chat(self, user: str, history: Optional[List[Dict[str, Any]]] = None, **params: Any) -> Dict[str, Any]:
+        """Stateless chat turn: pass the running ``history`` back in each time."""
+        return self.request({"kind": "chat", "user": user, "history": history, "params": params})
+
+    def complete(self, prompt: str, **params: Any) -> Dict[str, Any]:
+        return self.request({"kind": "complete", "prompt": prompt, "params": params})
+
+    def stats(self) -> Dict[str, Any]:
+        import psutil
+
+        with self._lock:
+            workers = [
+                {"pid": w.pid, "served": w.served, "rss_mb": w.last_rss_mb, "pss_mb": w.last_pss_mb, "fork_ms": w.fork_ms}
+                for w in self._workers
+            ]
+        return {
+            "load_seconds": self.load_seconds,
+            "parent": _memory_mb(psutil.Process()),
+            "workers": workers,
+            "recycled": self.recycled,
+        }
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=self.health_interval + 1)
+        with self._lock:
+            for worker in self._workers:
+                self._retire(worker, kill=False)
+            self._workers = []
+
+    def __enter__(self) -> "ForkServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+
+
+def main() -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Load a model once and serve prompts from forked workers.")
+    ap.add_argument("--model", type=str, default="./models/orca-mini-3b.Q4_0.gguf")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=2, help="llama.cpp threads per worker")
+    ap.add_argument("--ctx", type=int, default=2048)
+    ap.add_argument("--max-tokens", type=int, default=128)
+    args = ap.parse_args()
+
+    server = ForkServer(args.model, n_workers=args.workers, n_threads=args.threads, n_ctx=args.ctx)
+    with server:
+        stats = server.stats()
+        print(f"Model loaded once in {stats['load_seconds']:.2f}s; workers forked in "
+              + ", ".join(f"{w['fork_ms']:.1f}ms" for w in stats["workers"]))
+        print("Type a prompt (empty line to quit).")
+        while True:
+            prompt = input("> ").strip()
+            if not prompt:
+                break
+            result = server.chat(prompt, max_tokens=args.max_tokens)
+            if not result.get("ok"):
+                print(f"(error: {result.get('error')})")
+                continue
+            print(f"[pid {result['pid']}] {result['reply']}\n-- {result['elapsed']:.2f}s --")
+        for w in server.health_check():
+            print(f"worker {w['pid']}: {w['status']}, RSS {w.get('rss_mb', 0):.0f} MB, PSS {w.get('pss_mb', 0):.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""CLIP image encoding and a content-addressed embedding cache for LLaVA models.
+
+Encoding a photo through the vision projector is the most expensive part of a
+multimodal turn on CPU.  Embeddings are keyed by the SHA-256 of the image bytes
+plus the projector file, kept in an in-memory LRU and mirrored to ``.npy`` files
+on disk, so a product photo is encoded once no matter how many questions are
+asked about it (or how often the app restarts).
+"""
+
+from __future__ import annotations
+
+import ctypes
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+from memory_governor import MB, MemoryGovernor
+
+DEFAULT_CACHE_DIR = "./models/cache/image_embeds"
+
+ImageSource = Union[str, bytes]
+
+
+@dataclass
+class ImageEmbedding:
+    key: str
+    n_image_pos: int
+    data: np.ndarray  # float32, shape (n_image_pos * n_embd,)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes)
+
+
+def read_image_bytes(source: ImageSource) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    with open(source, "rb") as f:
+        return f.read()
+
+
+class ImageEmbeddingCache:
+    """Two-level (memory LRU + disk) cache of image embeddings."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        *,
+        max_memory_mb: float = 512.0,
+        governor: Optional[MemoryGovernor] = None,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = int(max_memory_mb * MB)
+        self.governor = governor
+        self._resident_name = f"image-embeds#{id(self):x}"
+        self._memory: "OrderedDict[str, ImageEmbedding]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key_for(image_bytes: bytes, clip_model_path: str) -> str:
+        digest = hashlib.sha256(image_bytes)
+        digest.update(os.path.basename(clip_model_path).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _remember(self, embedding: ImageEmbedding) -> None:
+        with self._lock:
+            old = self._memory.pop(embedding.key, None)
+            if old is not None:
+                self._memory_bytes -= old.nbytes
+            self._memory[embedding.key] = embedding
+            self._memory_bytes += embedding.nbytes
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+            size_mb = self._memory_bytes / MB
+        if self.governor is not None:
+            self.governor.register(self._resident_name, size_mb, kind="embedding", evict=self.clear_memory)
+
+    def get(self, key: str) -> Optional[ImageEmbedding]:
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return embedding
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            self.stats["misses"] += 1
+            return None
+        array = np.load(path)
+        embedding = ImageEmbedding(key, int(array.shape[0]), array.reshape(-1))
+        self.stats["disk_hits"] += 1
+        self._remember(embedding)
+        return embedding
+
+    def put(self, embedding: ImageEmbedding, n_embd: int) -> None:
+        self._remember(embedding)
+        path = self._disk_path(embedding.key)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, embedding.data.reshape(embedding.n_image_pos, n_embd))
+        os.replace(tmp_path, path)
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.governor is not None:
+            self.governor.release(self._resident_name)
+
+
+class ClipEncoder:
+    """Thin wrapper over llama.cpp's LLaVA projector (``llava_cpp``); runs on CPU."""
+
+    def __init__(self, clip_model_path: str, *, n_threads: int = 4, verbose: bool = False) -> None:
+        from llama_cpp import llava_cpp
+
+        self._llava_cpp = llava_cpp
+        self.clip_model_path = clip_model_path
+        self.n_threads = n_threads
+        self._ctx = llava_cpp.clip_model_load(clip_model_path.encode("utf-8"), 1 if verbose else 0)
+        if not self._ctx:
+            raise ValueError(f"Failed to load clip model: {clip_model_path}")
+
+    def encode(self, image_bytes: bytes, key: str, n_embd: int) -> ImageEmbedding:
+        buffer = (ctypes.c_uint8 * len(image_bytes)).from_buffer_copy(image_bytes)
+        embed = self._llava_cpp.llava_image_embed_make_with_bytes(
+            self._ctx, self.n_threads, buffer, len(image_bytes)
+        )
+        if not embed:
+            raise ValueError("Failed to encode image")
+        try:
+            n_image_pos = int(embed.contents.n_image_pos)
+            data = np.ctypeslib.as_array(embed.contents.embed, shape=(n_image_pos * n_embd,)).copy()
+        finally:
+            self._llava_cpp.llava_image_embed_free(embed)
+        return ImageEmbedding(key, n_image_pos, data.astype(np.float32, copy=False))
+
+    def eval_embedding(self, llm: Any, embedding: ImageEmbedding) -> None:
+        """Feed ``embedding`` into ``llm`` at its current position and advance it."""
+        data = np.ascontiguousarray(embedding.data, dtype=np.float32)
+        embed = self._llava_cpp.llava_image_embed(
+            embed=data.ctypes.data_as(ctypes.POINTER(ctypes.c_float)),
+            n_image_pos=embedding.n_image_pos,
+        )
+        n_past = ctypes.c_int(llm.n_tokens)
+        ok = self._llava_cpp.llava_eval_image_embed(llm.ctx, ctypes.byref(embed), llm.n_batch, ctypes.byref(n_past))
+        if not ok:
+            raise RuntimeError("llava_eval_image_embed failed")
+        # Image positions carry no token id; mark them so prefix matching never reuses them by accident.
+        llm.input_ids[llm.n_tokens : n_past.value] = -1
+        llm.n_tokens = n_past.value
+
+    def close(self) -> None:
+        if self._ctx:
+            self._llava_cpp.clip_free(self._ctx)
+            self._ctx = None
@@ -0,0 +1,429 @@
+"""Closed-loop multi-user load generator for the chat backend.
+
+Simulated receptionist customers arrive as a Poisson process, replay scripted
+multi-turn conversations with random think time between turns, and wait for
+each reply before sending the next message.  The generator runs one load level
+per user count and reports throughput, queue wait, TTFT and end-to-end latency
+percentiles over time, plus the user count at which latency blows up.
+
+Targets:
+  * ``inproc`` - one ``ChatBot`` served by a single worker thread, the same way
+    the GUI uses it.  Requests queue in front of the model, so queue wait is
+    measured exactly.
+  * ``http`` - any local OpenAI-compatible endpoint (e.g. ``python -m
+    llama_cpp.server``).  Queueing happens inside the server, so only TTFT and
+    end-to-end latency are observable.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+DEFAULT_SCRIPTS: List[List[str]] = [
+    [
+        "Hi, do you have any jeans in size 32?",
+        "How much are they?",
+        "Can I return them if they don't fit?",
+    ],
+    [
+        "I'm looking for a warm jacket under $100.",
+        "Do you have it in black?",
+        "Great, what about a matching scarf?",
+    ],
+    [
+        "What is your return policy?",
+        "Do I need the receipt?",
+    ],
+    [
+        "Can you recommend a gift for my sister? Budget is around $50.",
+        "She likes accessories.",
+        "Is the handbag in stock?",
+        "Thanks, I'll take it.",
+    ],
+]
+RECEPTIONIST_PROMPT = (
+    "You are a professional and helpful shop receptionist in a clothing & accessories store. "
+    "Answer briefly and always give concrete prices and policies."
+)
+
+
+@dataclass
+class TurnRecord:
+    user_id: int
+    turn: int
+    submit: float
+    start: Optional[float] = None
+    first_token: Optional[float] = None
+    end: Optional[float] = None
+    chars: int = 0
+    ok: bool = True
+    error: str = ""
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        return None if self.start is None else self.start - self.submit
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return None if self.first_token is None else self.first_token - self.submit
+
+    @property
+    def latency(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.submit
+
+
+# ----------------------------------------------------------------------
+# Targets
+# ----------------------------------------------------------------------
+class InProcessTarget:
+    """Serialises all users through one ``ChatBot`` on a dedicated worker thread."""
+
+    def __init__(self, model_path: str, *, system_prompt: str, gen_kwargs: Dict[str, Any], **bot_kwargs: Any) -> None:
+        from chat_backend import ChatBot
+
+        self.bot = ChatBot(model_path, system_prompt=system_prompt, **bot_kwargs)
+        self.gen_kwargs = gen_kwargs
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._worker = threading.Thread(target=self._serve, daemon=True)
+        self._worker.start()
+
+    def new_session(self) -> Dict[str, Any]:
+        return {"messages": [{"role": "system", "content": self.bot.system_prompt}]}
+
+    def _serve(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            session, text, record, done = item
+            record.start = time.perf_counter()
+
+            def on_token(piece: str) -> None:
+                if record.first_token is None:
+                    record.first_token = time.perf_counter()
+
+            try:
+                self.bot.messages = session["messages"]
+                reply, _, _ = self.bot.chat(text, on_token=on_token, **self.gen_kwargs)
+                session["messages"] = self.bot.messages
+                record.chars = len(reply)
+                if reply.startswith("(模型调用异常"):
+                    record.ok = False
+                    record.error = reply
+            except Exception as exc:
+                record.ok = False
+                record.error = str(exc)
+            finally:
+                record.end = time.perf_counter()
+                done.set()
+
+    def submit(self, session: Dict[str, Any], text: str, record: TurnRecord) -> None:
+        done = threading.Event()
+        self._queue.put((session, text, record, done))
+        done.wait()
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+
+class HttpTarget:
+    """Streams chat completions from a local OpenAI-compatible server."""
+
+    def __init__(self, url: str, *, system_prompt: str, gen_kwargs: Dict[str, Any], model: Optional[str] = None) -> None:
+        import requests
+
+        self._requests = requests
+        self.url = url.rstrip("/") + "/v1/chat/completions"
+        self.system_prompt = system_prompt
+        self.gen_kwargs = gen_kwargs
+        self.model = model
+
+    def new_session(self) -> Dict[str, Any]:
+        return {"messages": [{"role": "system", "content": self.system_prompt}]}
+
+    def submit(self, session: Dict[str, Any], text: str, record: TurnRecord) -> None:
+        session["messages"].append({"role": "user", "content": text})
+        payload: Dict[str, Any] = dict(self.gen_kwargs, messages=session["messages"], stream=True)
+        if self.model:
+            payload["model"] = self.model
+        parts: List[str] = []
+        try:
+            with self._requests.post(self.url, json=payload, stream=True, timeout=600) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices", [])
+                    piece = choices[0].get("delta", {}).get("content") if choices else None
+                    if piece:
+                        if record.first_token is None:
+                            record.first_token = time.perf_counter()
+                        parts.append(piece)
+        except Exception as exc:
+            record.ok = False
+            record.error = str(exc)
+        record.end = time.perf_counter()
+        reply = "".join(parts)
+        record.chars = len(reply)
+        session["messages"].append({"role": "assistant", "content": reply})
+
+    def close(self) -> None:
+        pass
+
+
+# ----------------------------------------------------------------------
+# Load generation
+# ----------------------------------------------------------------------
+def _run_user(
+    target: Any,
+    user_id: int,
+    scripts: Sequence[Sequence[str]],
+    *,
+    arrive_at: float,
+    deadline: float,
+    think_mean: float,
+    rng: random.Random,
+    records: List[TurnRecord],
+    lock: threading.Lock,
+) -> None:
+    delay = arrive_at - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+    conversation = user_id
+    while time.perf_counter() < deadline:
+        script = scripts[conversation % len(scripts)]
+        session = target.new_session()
+        for turn, text in enumerate(script):
+            if time.perf_counter() >= deadline:
+                return
+            record = TurnRecord(user_id=user_id, turn=turn, submit=time.perf_counter())
+            target.submit(session, text, record)
+            with lock:
+                records.append(record)
+            if think_mean > 0:
+                time.sleep(rng.expovariate(1.0 / think_mean))
+        conversation += 1
+
+
+def run_level(
+    target: Any,
+    n_users: int,
+    scripts: Sequence[Sequence[str]],
+    *,
+    duration: float,
+    arrival_rate: float,
+    think_mean: float,
+    seed: int,
+) -> Dict[str, Any]:
+    """Drive ``n_users`` closed-loop users for ``duration`` seconds."""
+    rng = random.Random(seed)
+    records: List[TurnRecord] = []
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+    deadline = t0 + duration
+    arrive_at = t0
+    threads = []
+    for user_id in range(n_users):
+        if arrival_rate > 0 and user_id > 0:
+            arrive_at += rng.expovariate(arrival_rate)
+        thread = threading.Thread(
+            target=_run_user,
+            args=(target, user_id, scripts),
+            kwargs=dict(
+                arrive_at=arrive_at,
+                deadline=deadline,
+                think_mean=think_mean,
+                rng=random.Random(rng.random()),
+                records=records,
+                lock=lock,
+            ),
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    return {"users": n_users, "t0": t0, "elapsed": elapsed, "records": records}
+
+
+# ----------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def _stats(values: Sequence[Optional[float]]) -> Dict[str, Optional[float]]:
+    present = [v for v in values if v is not None]
+    return {f"p{q}": percentile(present, q) for q in (50, 95, 99)}
+
+
+def summarize(level: Dict[str, Any]) -> Dict[str, Any]:
+    records: List[TurnRecord] = [r for r in level["records"] if r.ok]
+    failed = len(level["records"]) - len(records)
+    return {
+        "users": level["users"],
+        "turns": len(records),
+        "failed": failed,
+        "throughput": len(records) / level["elapsed"] if level["elapsed"] > 0 else 0.0,
+        "queue_wait": _stats([r.queue_wait for r in records]),
+        "ttft": _stats([r.ttft for r in records]),
+        "latency": _stats([r.latency for r in records]),
+    }
+
+
+def timeline(level: Dict[str, Any], window: float) -> List[Dict[str, Any]]:
+    """Bucket completed turns by finish time into ``window``-second slices."""
+    buckets: Dict[int, List[TurnRecord]] = {}
+    for record in level["records"]:
+        if record.ok and record.end is not None:
+            buckets.setdefault(int((record.end - level["t0"]) // window), []).append(record)
+    rows = []
+    for index in sorted(buckets):
+        bucket = buckets[index]
+        rows.append(
+            {
+                "t": index * window,
+                "turns": len(bucket),
+                "throughput": len(bucket) / window,
+                "latency": _stats([r.latency for r in bucket]),
+                "ttft": _stats([r.ttft for r in bucket]),
+            }
+        )
+    return rows
+
+
+def find_saturation(summaries: Sequence[Dict[str, Any]], knee: float) -> Optional[int]:
+    """First user count whose p95 latency exceeds ``knee`` times the lightest level's."""
+    baseline = None
+    for summary in summaries:
+        p95 = summary["latency"]["p95"]
+        if p95 is None:
+            continue
+        if baseline is None:
+            baseline = p95
+            continue
+        if p95 > knee * baseline:
+            return summary["users"]
+    return None
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "   -   " if value is None else f"{value:7.2f}"
+
+
+def print_report(summaries: Sequence[Dict[str, Any]], timelines: Dict[int, List[Dict[str, Any]]], knee: float) -> None:
+    for summary in summaries:
+        users = summary["users"]
+        print(f"\n== {users} user(s): timeline ==")
+        print("     t   turns turns/s  lat p50  lat p95  ttft p50")
+        for row in timelines.get(users, []):
+            print(
+                f"{row['t']:6.0f}  {row['turns']:6d}  {row['throughput']:6.2f}"
+                f"  {_fmt(row['latency']['p50'])}  {_fmt(row['latency']['p95'])}  {_fmt(row['ttft']['p50'])}"
+            )
+    print("\n== Summary (seconds) ==")
+    print("users  turns  fail  turns/s   wait p95  ttft p50  ttft p95   lat p50   lat p95   lat p99")
+    for s in summaries:
+        print(
+            f"{s['users']:5d}  {s['turns']:5d}  {s['failed']:4d}  {s['throughput']:7.3f}"
+            f"   {_fmt(s['queue_wait']['p95'])}   {_fmt(s['ttft']['p50'])}   {_fmt(s['ttft']['p95'])}"
+            f"   {_fmt(s['latency']['p50'])}   {_fmt(s['latency']['p95'])}   {_fmt(s['latency']['p99'])}"
+        )
+    saturation = find_saturation(summaries, knee)
+    if saturation is None:
+        print(f"\nSaturation: not reached (p95 latency stayed within {knee:.1f}x of the lightest level)")
+    else:
+        print(f"\nSaturation: {saturation} users (p95 latency > {knee:.1f}x the lightest level)")
+
+
+def _load_scripts(path: Optional[str]) -> List[List[str]]:
+    if not path:
+        return DEFAULT_SCRIPTS
+    with open(path, "r", encoding="utf-8") as f:
+        scripts = json.load(f)
+    if not scripts or not all(isinstance(s, list) and s for s in scripts):
+        raise ValueError("Script file must be a JSON list of non-empty lists of user messages")
+    return scripts
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Closed-loop load generator for chat_backend.")
+    ap.add_argument("--target", choices=["inproc", "http"], default="inproc")
+    ap.add_argument("--model", type=str, default="./models/orca-mini-3b.Q4_0.gguf")
+    ap.add_argument("--url", type=str, default="http://127.0.0.1:8000")
+    ap.add_argument("--users", type=str, default="1,2,4,8", help="Comma-separated user counts, one level each")
+    ap.add_argument("--duration", type=float, default=120.0, help="Seconds per load level")
+    ap.add_argument("--arrival-rate", type=float, default=0.5, help="Poisson user arrivals per second (0 = all at once)")
+    ap.add_argument("--think-time", type=float, default=3.0, help="Mean think time between turns in seconds")
+    ap.add_argument("--script", type=str, default=None, help="JSON file: list of conversations (lists of messages)")
+    ap.add_argument("--max-tokens", type=int, default=128)
+    ap.add_argument("--temp", type=float, default=0.7)
+    ap.add_argument("--ctx", type=int, default=2048)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--window", type=float, default=10.0, help="Timeline bucket size in seconds")
+    ap.add_argument("--knee", type=float, default=3.0, help="p95 latency growth factor that marks saturation")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json-out", type=str, default=None, help="Write per-turn records and summaries here")
+    args = ap.parse_args()
+
+    scripts = _load_scripts(args.script)
+    gen_kwargs = dict(max_tokens=args.max_tokens, temperature=args.temp)
+    if args.target == "inproc":
+        target: Any = InProcessTarget(
+            args.model,
+            system_prompt=RECEPTIONIST_PROMPT,
+            gen_kwargs=gen_kwargs,
+            n_ctx=args.ctx,
+            n_threads=args.threads,
+        )
+    else:
+        target = HttpTarget(args.url, system_prompt=RECEPTIONIST_PROMPT, gen_kwargs=gen_kwargs)
+
+    summaries: List[Dict[str, Any]] = []
+    timelines: Dict[int, List[Dict[str, Any]]] = {}
+    raw: List[Dict[str, Any]] = []
+    try:
+        for n_users in [int(u) for u in args.users.split(",") if u.strip()]:
+            print(f"[load] running {n_users} user(s) for {args.duration:.0f}s ...")
+            level = run_level(
+                target,
+                n_users,
+                scripts,
+                duration=args.duration,
+                arrival_rate=args.arrival_rate,
+                think_mean=args.think_time,
+                seed=args.seed + n_users,
+            )
+            summaries.append(summarize(level))
+            timelines[n_users] = timeline(level, args.window)
+            raw.extend(dict(asdict(r), users=n_users, t0=level["t0"]) for r in level["records"])
+    finally:
+        target.close()
+
+    print_report(summaries, timelines, args.knee)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"summaries": summaries, "timelines": timelines, "records": raw}, f, ensure_ascii=False, indent=2)
+        print(f"Raw results written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""RSS-aware memory budgeting for model loads and in-process caches.
+
+The governor keeps a ledger of everything large the backend holds in memory
+(loaded models with their KV cache, saved llama.cpp states, ...).  Before a
+model is loaded it estimates the cost from the GGUF header and the requested
+context size, compares it with the budget, the process RSS and the memory the
+OS still has available, and then admits the load, evicts other residents,
+lowers ``n_ctx``, waits for memory to be released, or refuses.  Every decision
+is reported as a ``MemoryEvent`` so front ends can show it.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+MB = 1024 ** 2
+# Conservative per-token KV size (7B, no GQA, f16) used when the header is unreadable.
+_FALLBACK_KV_BYTES_PER_TOKEN = 2 * 32 * 4096 * 2
+# Eviction order: cheap-to-rebuild residents go first.
+_EVICT_ORDER = {"state": 0, "embedding": 1, "model": 2}
+
+_GGUF_SCALARS = {
+    0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i",
+    6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d",
+}
+_GGUF_STRING, _GGUF_ARRAY = 8, 9
+
+
+class MemoryBudgetError(RuntimeError):
+    """Raised when a load cannot fit in the memory budget even after eviction."""
+
+
+@dataclass
+class MemoryEvent:
+    kind: str  # admit | evict | shrink_ctx | defer | refuse | pressure
+    message: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    ts: float = field(default_factory=time.time)
+
+
+@dataclass
+class Resident:
+    name: str
+    size_mb: float
+    kind: str = "model"
+    evict: Optional[Callable[[], None]] = None
+    last_used: float = field(default_factory=time.monotonic)
+
+
+# ----------------------------------------------------------------------
+# Size estimates
+# ----------------------------------------------------------------------
+def _read_gguf_value(fh, value_type: int) -> Any:
+    if value_type in _GGUF_SCALARS:
+        fmt = _GGUF_SCALARS[value_type]
+        return struct.unpack(fmt, fh.read(struct.calcsize(fmt)))[0]
+    if value_type == _GGUF_STRING:
+        (length,) = struct.unpack("<Q", fh.read(8))
+        return fh.read(length).decode("utf-8", errors="replace")
+    if value_type == _GGUF_ARRAY:
+        elem_type, count = struct.unpack("<IQ", fh.read(12))
+        if elem_type in _GGUF_SCALARS:
+            # Skip numeric arrays (token scores, types) without decoding them.
+            fh.seek(count * struct.calcsize(_GGUF_SCALARS[elem_type]), os.SEEK_CUR)
+            return None
+        for _ in range(count):
+            _read_gguf_value(fh, elem_type)
+        return None
+    raise ValueError(f"Unknown GGUF value type {value_type}")
+
+
+def read_gguf_metadata(path: str) -> Dict[str, Any]:
+    """Read scalar key/value metadata from a GGUF header (arrays are skipped)."""
+    metadata: Dict[str, Any] = {}
+    with open(path, "rb") as fh:
+        if fh.read(4) != b"GGUF":
+            raise ValueError(f"Not a GGUF file: {path}")
+        (version,) = struct.unpack("<I", fh.read(4))
+        if version < 2:
+            raise ValueError(f"Unsupported GGUF version {version}")
+        _, n_kv = struct.unpack("<QQ", fh.read(16))
+        for _ in range(n_kv):
+            (key_len,) = struct.unpack("<Q", fh.read(8))
+            key = fh.read(key_len).decode("utf-8", errors="replace")
+            (value_type,) = struct.unpack("<I", fh.read(4))
+            value = _read_gguf_value(fh, value_type)
+            if value is not None:
+                metadata[key] = value
+    return metadata
+
+
+def kv_bytes_per_token(metadata: Dict[str, Any], type_bytes: int = 2) -> int:
+    arch = metadata.get("general.architecture", "llama")
+    try:
+        n_layer = int(metadata[f"{arch}.block_count"])
+        n_embd = int(metadata[f"{arch}.embedding_length"])
+        n_head = int(metadata[f"{arch}.attention.head_count"])
+    except (KeyError, ValueError, TypeError):
+        return _FALLBACK_KV_BYTES_PER_TOKEN
+    n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head) or n_head)
+    n_embd_kv = n_embd * n_head_kv // max(n_head, 1)
+    return 2 * n_layer * n_embd_kv * type_bytes
+
+
+def estimate_model_mb(model_path: str) -> float:
+    """Weights are memory-mapped, so once touched they cost about their file size."""
+    return os.path.getsize(model_path) / MB
+
+
+def estimate_kv_mb(model_path: str, n_ctx: int) -> float:
+    try:
+        per_token = kv_bytes_per_token(read_gguf_metadata(model_path))
+    except (OSError, ValueError, struct.error):
+        per_token = _FALLBACK_KV_BYTES_PER_TOKEN
+    return per_token * n_ctx / MB
+
+
+# ----------------------------------------------------------------------
+# Governor
+# ----------------------------------------------------------------------
+class MemoryGovernor:
+    """Admission control and eviction for large in-memory residents."""
+
+    def __init__(
+        self,
+        budget_mb: Optional[float] = None,
+        *,
+        reserve_mb: float = 1024.0,
+        overhead_mb: float = 256.0,
+        min_ctx: int = 512,
+        on_event: Optional[Callable[[MemoryEvent], None]] = None,
+    ) -> None:
+        import psutil
+
+        total_mb = psutil.virtual_memory().total / MB
+        self.budget_mb = budget_mb if budget_mb is not None else total_mb * 0.8
+        self.reserve_mb = reserve_mb
+        self.overhead_mb = overhead_mb
+        self.min_ctx = min_ctx
+        self.on_event = on_event
+        self.events: List[MemoryEvent] = []
+        self._residents: Dict[str, Resident] = {}
+        self._process = psutil.Process()
+        self._lock = threading.RLock()
+        self._released = threading.Condition(self._lock)
+        # RSS when check() last evicted; None while not under pressure
+        self._pressure_rss: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Bookkeeping
+    # ------------------------------------------------------------------
+    def _emit(self, kind: str, message: str, **data: Any) -> MemoryEvent:
+        event = MemoryEvent(kind, message, data)
+        self.events.append(event)
+        del self.events[:-200]
+        if self.on_event is not None:
+            try:
+                self.on_event(event)
+            except Exception as exc:  # pragma: no cover - callbacks must not break loads
+                print(f"[MemoryGovernor] on_event failed: {exc}")
+        return event
+
+    def snapshot(self) -> Dict[str, float]:
+        import psutil
+
+        vm = psutil.virtual_memory()
+        with self._lock:
+            tracked = sum(r.size_mb for r in self._residents.values())
+        return {
+            "rss_mb": self._process.memory_info().rss / MB,
+            "available_mb": vm.available / MB,
+            "total_mb": vm.total / MB,
+            "tracked_mb": tracked,
+            "budget_mb": self.budget_mb,
+        }
+
+    def register(
+        self,
+        name: str,
+        size_mb: float,
+        *,
+        kind: str = "model",
+        evict: Optional[Callable[[], None]] = None,
+    ) -> None:
+        with self._lock:
+            self._residents[name] = Resident(name, size_mb, kind, evict)
+
+    def touch(self, name: str) -> None:
+        with self._lock:
+            resident = self._residents.get(name)
+            if resident is not None:
+                resident.last_used = time.monotonic()
+
+    def release(self, name: str) -> None:
+        with self._lock:
+            if self._residents.pop(name, None) is not None:
+                self._released.notify_all()
+
+    def residents(self) -> List[Resident]:
+        with self._lock:
+            return list(self._residents.values())
+
+    def _headroom_mb(self) -> float:
+        snap = self.snapshot()
+        return min(self.budget_mb - snap["rss_mb"], snap["available_mb"] - self.reserve_mb)
+
+    def _evict_one(self, exclude: str, kinds: Optional[List[str]] = None) -> Optional[Resident]:
+        with self._lock:
+            candidates = [
+                r
+                for r in self._residents.values()
+                if r.name != exclude and r.evict is not None and (kinds is None or r.kind in kinds)
+            ]
+            if not candidates:
+                return None
+            victim = min(candidates, key=lambda r: (_EVICT_ORDER.get(r.kind, 1), r.last_used))
+            self._residents.pop(victim.name, None)
+        try:
+            victim.evict()
+        except Exception as exc:  # pragma: no cover - defensive logging
+            print(f"[MemoryGovernor] Failed to evict {victim.name}: {exc}")
+        self._emit("evict", f"已释放 {victim.name} (~{victim.size_mb:.0f} MB)", name=victim.name, size_mb=victim.size_mb)
+        return victim
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+    def plan_load(self, name: str, model_path: str, n_ctx: int, *, wait_s: float = 0.0) -> int:
+        """Make room for a model load and return the ``n_ctx`` it may use.
+
+        Raises ``MemoryBudgetError`` when the model does not fit even after
+        evicting other residents, shrinking the context and waiting ``wait_s``.
+        """
+        model_mb = estimate_model_mb(model_path) + self.overhead_mb
+        deadline = time.monotonic() + wait_s
+        label = os.path.basename(model_path)
+        while True:
+            headroom = self._headroom_mb()
+            ctx = n_ctx
+            need = model_mb + estimate_kv_mb(model_path, ctx)
+            # Freed memory is credited immediately; RSS only drops once pages are returned.
+            while need > headroom:
+                victim = self._evict_one(exclude=name)
+                if victim is None:
+                    break
+                headroom += victim.size_mb
+            while need > headroom and ctx // 2 >= self.min_ctx:
+                ctx //= 2
+                need = model_mb + estimate_kv_mb(model_path, ctx)
+            if need <= headroom:
+                if ctx != n_ctx:
+                    self._emit(
+                        "shrink_ctx",
+                        f"内存紧张，{label} 的 n_ctx 从 {n_ctx} 降到 {ctx}",
+                        name=name,
+                        requested=n_ctx,
+                        n_ctx=ctx,
+                    )
+                self._emit("admit", f"允许加载 {label} (~{need:.0f} MB)", name=name, need_mb=need, n_ctx=ctx)
+                return ctx
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._emit(
+                    "refuse",
+                    f"内存不足，拒绝加载 {label}：需要 ~{need:.0f} MB，可用 ~{max(headroom, 0):.0f} MB",
+                    name=name,
+                    need_mb=need,
+                    headroom_mb=headroom,
+                )
+                raise MemoryBudgetError(
+                    f"Loading {label} needs ~{need:.0f} MB but only ~{max(headroom, 0):.0f} MB fits the budget"
+                )
+            self._emit("defer", f"内存不足，等待其他资源释放后再加载 {label}", name=name, need_mb=need)
+            with self._released:
+                self._released.wait(timeout=remaining)
+
+    def check(self) -> Optional[MemoryEvent]:
+        """Per-turn pressure check; drops cached states when over budget.
+
+        Staying over budget is normal for a big model on a small box, so an
+        event is only emitted when pressure starts or something was freed,
+        and caches are only dropped again once RSS has grown past the last
+        eviction by ``overhead_mb``.
+        """
+        snap = self.snapshot()
+        over_budget = snap["rss_mb"] > self.budget_mb
+        low_system = snap["available_mb"] < self.reserve_mb
+        if not (over_budget or low_system):
+            self._pressure_rss = None
+            return None
+        entering = self._pressure_rss is None
+        if not entering and snap["rss_mb"] < self._pressure_rss + self.overhead_mb:
+            return None
+        self._pressure_rss = snap["rss_mb"]
+        freed = 0.0
+        while True:
+            victim = self._evict_one(exclude="", kinds=["state", "embedding"])
+            if victim is None:
+                break
+            freed += victim.size_mb
+            if snap["rss_mb"] - freed <= self.budget_mb and snap["available_mb"] + freed >= self.reserve_mb:
+                break
+        if not entering and freed <= 0:
+            return None
+        return self._emit(
+            "pressure",
+            f"内存压力：RSS {snap['rss_mb']:.0f} MB / 预算 {self.budget_mb:.0f} MB，系统可用 {snap['available_mb']:.0f} MB",
+            freed_mb=freed,
+            **snap,
+        )
@@ -0,0 +1,276 @@
+"""Radix-tree cache of llama.cpp states keyed by token prefix.
+
+``llama_cpp.Llama`` asks its cache for the state whose tokens share the longest
+prefix with a new prompt, loads it when that beats what is already in the KV
+cache, and only evaluates the remaining suffix.  The stock ``LlamaRAMCache``
+finds that state with a linear scan over every key; here keys live in a
+compressed prefix tree and every node remembers the freshest state below it,
+so a lookup costs one walk down the prompt (and back up when the match ends
+in a branch without states).  Matches shorter than ``min_prefix_tokens`` count
+as misses: every prompt shares BOS, and loading a whole state to reuse a
+handful of tokens costs more than evaluating them.  States are capped by total
+size and evicted least-recently-used first.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from llama_cpp import BaseLlamaCache, LlamaState
+
+from memory_governor import MB, MemoryGovernor
+
+
+class _Node:
+    __slots__ = ("edge", "children", "parent", "state", "last_used", "latest")
+
+    def __init__(self, edge: Tuple[int, ...] = (), parent: Optional["_Node"] = None) -> None:
+        self.edge = edge
+        self.children: Dict[int, "_Node"] = {}
+        self.parent = parent
+        self.state: Optional[LlamaState] = None
+        self.last_used = 0.0
+        # Most recently used node with a state in this subtree (self included)
+        self.latest: Optional["_Node"] = None
+
+
+def _common_length(a: Sequence[int], b: Sequence[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class PrefixCache(BaseLlamaCache):
+    """Drop-in ``Llama.set_cache`` cache with LRU eviction and hit-rate stats."""
+
+    def __init__(
+        self,
+        capacity_bytes: int = 1 << 30,
+        *,
+        governor: Optional[MemoryGovernor] = None,
+        name: Optional[str] = None,
+        min_prefix_tokens: int = 16,
+    ) -> None:
+        super().__init__(capacity_bytes)
+        self.min_prefix_tokens = max(min_prefix_tokens, 1)
+        self.governor = governor
+        self._resident_name = name or f"prefix-cache#{id(self):x}"
+        self._root = _Node()
+        self._size = 0
+        self._lock = threading.RLock()
+        self.stats: Dict[str, int] = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "reused_tokens": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Tree helpers
+    # ------------------------------------------------------------------
+    def _walk(self, key: Sequence[int]) -> Tuple[_Node, int]:
+        """Deepest node reached by ``key`` and how many tokens matched in total.
+
+        When the match ends inside an edge, the child owning that edge is
+        returned; every state below it shares exactly ``matched`` tokens.
+        """
+        node, matched = self._root, 0
+        while matched < len(key):
+            child = node.children.get(key[matched])
+            if child is None:
+                break
+            common = _common_length(child.edge, key[matched:])
+            matched += common
+            node = child
+            if common < len(child.edge):
+                break
+        return node, matched
+
+    @staticmethod
+    def _states_below(node: _Node) -> Iterator[_Node]:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.state is not None:
+                yield current
+            stack.extend(current.children.values())
+
+    def _find(self, key: Sequence[int]) -> Tuple[Optional[_Node], int]:
+        node, matched = self._walk(key)
+        # Anything under the divergence point shares ``matched`` tokens; prefer
+        # the freshest. If that subtree is empty, widen to each ancestor's.
+        shared = matched
+        current: Optional[_Node] = node
+        while current is not None:
+            if current.latest is not None:
+                return current.latest, shared
+            current = current.parent
+            if current is not None:
+                shared = min(shared, self._depth(current))
+        return None, 0
+
+    @staticmethod
+    def _touch(node: _Node) -> None:
+        """Mark ``node`` (which holds a state) as the freshest on its path."""
+        node.last_used = time.monotonic()
+        current: Optional[_Node] = node
+        while current is not None:
+            current.latest = node
+            current = current.parent
+
+    @staticmethod
+    def _refresh(node: Optional[_Node]) -> None:
+        """Recompute ``latest`` from ``node`` up after its state went away."""
+        while node is not None:
+            best = node if node.state is not None else None
+            for child in node.children.values():
+                if child.latest is not None and (best is None or child.latest.last_used > best.last_used):
+                    best = child.latest
+            node.latest = best
+            node = node.parent
+
+    @staticmethod
+    def _depth(node: _Node) -> int:
+        depth = 0
+        current: Optional[_Node] = node
+        while current is not None:
+            depth += len(current.edge)
+            current = current.parent
+        return depth
+
+    def _insert(self, key: Sequence[int]) -> _Node:
+        node, pos = self._root, 0
+        while pos < len(key):
+            child = node.children.get(key[pos])
+            if child is None:
+                leaf = _Node(tuple(key[pos:]), node)
+                node.children[key[pos]] = leaf
+                return leaf
+            common = _common_length(child.edge, key[pos:])
+            if common < len(child.edge):
+                # Split the edge so the shared part becomes its own node.
+                middle = _Node(child.edge[:common], node)
+                middle.latest = child.latest
+                node.children[key[pos]] = middle
+                child.edge = child.edge[common:]
+                child.parent = middle
+                middle.children[child.edge[0]] = child
+                child = middle
+            node = child
+            pos += common
+        return node
+
+    def _prune(self, node: _Node) -> None:
+        """Remove empty leaves and merge single-child chains left by eviction."""
+        while node is not self._root and node.state is None:
+            parent = node.parent
+            assert parent is not None
+            if not node.children:
+                del parent.children[node.edge[0]]
+                node = parent
+                continue
+            if len(node.children) == 1:
+                (child,) = node.children.values()
+                child.edge = node.edge + child.edge
+                child.parent = parent
+                parent.children[child.edge[0]] = child
+            break
+
+    def _evict_until(self, limit: int) -> None:
+        while self._size > limit:
+            victim = min(self._states_below(self._root), key=lambda n: n.last_used, default=None)
+            if victim is None:
+                break
+            assert victim.state is not None
+            self._size -= victim.state.llama_state_size
+            victim.state = None
+            self.stats["evictions"] += 1
+            self._refresh(victim)
+            self._prune(victim)
+
+    def _report_size(self) -> None:
+        if self.governor is None:
+            return
+        if self._size:
+            self.governor.register(self._resident_name, self._size / MB, kind="state", evict=self.clear)
+        else:
+            self.governor.release(self._resident_name)
+
+    # ------------------------------------------------------------------
+    # BaseLlamaCache interface
+    # ------------------------------------------------------------------
+    @property
+    def cache_size(self) -> int:
+        return self._size
+
+    def _find_longest_prefix_key(self, key: Tuple[int, ...]) -> Optional[Tuple[int, ...]]:
+        with self._lock:
+            node, _ = self._find(key)
+            if node is None:
+                return None
+            parts: List[Tuple[int, ...]] = []
+            current: Optional[_Node] = node
+            while current is not None:
+                parts.append(current.edge)
+                current = current.parent
+            return tuple(t for edge in reversed(parts) for t in edge)
+
+    def __getitem__(self, key: Sequence[int]) -> LlamaState:
+        with self._lock:
+            self.stats["lookups"] += 1
+            node, matched = self._find(key)
+            if node is None or node.state is None or matched < self.min_prefix_tokens:
+                self.stats["misses"] += 1
+                raise KeyError("Key not found")
+            self.stats["hits"] += 1
+            self.stats["reused_tokens"] += matched
+            self._touch(node)
+            return node.state
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        with self._lock:
+            node, matched = self._find(key)
+            return node is not None and matched >= self.min_prefix_tokens
+
+    def __setitem__(self, key: Sequence[int], value: LlamaState) -> None:
+        if not key:
+            return
+        with self._lock:
+            node = self._insert(tuple(key))
+            if node.state is not None:
+                self._size -= node.state.llama_state_size
+            node.state = value
+            self._touch(node)
+            self._size += value.llama_state_size
+            self.stats["stores"] += 1
+            self._evict_until(self.capacity_bytes)
+        self._report_size()
+
+    # ------------------------------------------------------------------
+    # Extras
+    # ------------------------------------------------------------------
+    def clear(self) -> None:
+        with self._lock:
+            self._root = _Node()
+            self._size = 0
+        self._report_size()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for _ in self._states_below(self._root))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["lookups"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.stats, entries=len(self), size_mb=self._size / MB, hit_rate=self.hit_rate)
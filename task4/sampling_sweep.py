@@ -0,0 +1,183 @@
+"""Compare sampling settings on one prompt without re-prefilling it.
+
+The prompt is evaluated once and the llama.cpp state is snapshotted.  Every
+config then decodes from that shared prefix: ``Llama.generate`` keeps the KV
+cache for a matching prompt, so only the reply tokens cost anything, and the
+snapshot is reloaded whenever a config disturbed the prefix (a context
+shift).  llama-cpp-python's ``Llama`` decodes a single sequence, so configs run
+one after another on the shared prefill rather than as parallel sequences.
+"""
+
+from __future__ import annotations
+
+import itertools
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import tracing
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+
+@dataclass(frozen=True)
+class SweepConfig:
+    temperature: float = 0.7
+    top_p: float = 0.9
+    top_k: int = 40
+    repeat_penalty: float = 1.1
+    seed: int = 0
+
+
+@dataclass
+class SweepRow:
+    config: SweepConfig
+    text: str
+    tokens: int
+    elapsed: float
+    finish_reason: Optional[str] = None
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@dataclass
+class SweepResult:
+    prompt_tokens: int
+    prefill_s: float
+    rows: List[SweepRow] = field(default_factory=list)
+
+    @property
+    def total_s(self) -> float:
+        return self.prefill_s + sum(row.elapsed for row in self.rows)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return [
+            dict(asdict(row.config), text=row.text, tokens=row.tokens, elapsed=row.elapsed,
+                 tokens_per_s=row.tokens_per_s, finish_reason=row.finish_reason)
+            for row in self.rows
+        ]
+
+    def table(self, width: int = 60) -> str:
+        lines = [
+            f"prompt {self.prompt_tokens} tokens, prefilled once in {self.prefill_s:.2f}s; "
+            f"{len(self.rows)} configs in {self.total_s:.2f}s total",
+            " temp  top_p  top_k  rep_pen  seed  tokens   time(s)  tok/s  reply",
+        ]
+        for row in self.rows:
+            c = row.config
+            reply = " ".join(row.text.split())
+            if len(reply) > width:
+                reply = reply[: width - 3] + "..."
+            lines.append(
+                f"{c.temperature:5.2f}  {c.top_p:5.2f}  {c.top_k:5d}  {c.repeat_penalty:7.2f}  {c.seed:4d}"
+                f"  {row.tokens:6d}  {row.elapsed:8.2f}  {row.tokens_per_s:5.1f}  {reply}"
+            )
+        return "\n".join(lines)
+
+
+def parameter_grid(
+    *,
+    temperature: Iterable[float] = (0.7,),
+    top_p: Iterable[float] = (0.9,),
+    top_k: Iterable[int] = (40,),
+    repeat_penalty: Iterable[float] = (1.1,),
+    seed: Iterable[int] = (0,),
+) -> List[SweepConfig]:
+    """Cartesian product of the given values as ``SweepConfig`` objects."""
+    return [
+        SweepConfig(t, p, int(k), r, int(s))
+        for t, p, k, r, s in itertools.product(temperature, top_p, top_k, repeat_penalty, seed)
+    ]
+
+
+def render_chat_prompt(llm: Llama, messages: Sequence[Dict[str, Any]]) -> Tuple[str, List[str], bool]:
+    """Chat messages as the prompt text ``create_chat_completion`` would build.
+
+    Uses the GGUF's own template when it has one and falls back to the
+    Llama-2 ``[INST]`` layout otherwise.  Returns ``(prompt, stop,
+    added_special)``; when the template already emitted BOS, tokenize with
+    ``add_bos=not added_special`` to avoid a second one.
+    """
+    template = llm.metadata.get("tokenizer.chat_template") if getattr(llm, "metadata", None) else None
+    if template:
+        try:
+            from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+            eos = llm.detokenize([llm.token_eos()]).decode("utf-8", errors="ignore")
+            bos = llm.detokenize([llm.token_bos()]).decode("utf-8", errors="ignore")
+            result = Jinja2ChatFormatter(template=template, eos_token=eos, bos_token=bos)(messages=list(messages))
+            stop = result.stop if isinstance(result.stop, list) else [result.stop] if result.stop else []
+            return result.prompt, stop, bool(getattr(result, "added_special", False))
+        except Exception:
+            pass  # e.g. templates that reject a system role
+
+    system = ""
+    parts: List[str] = []
+    for msg in messages:
+        role, content = msg.get("role"), msg.get("content", "")
+        if role == "system":
+            system = f"<<SYS>>\n{content}\n<</SYS>>\n\n"
+        elif role == "user":
+            parts.append(f"[INST] {system}{content} [/INST]")
+            system = ""
+        elif role == "assistant":
+            parts.append(f" {content} ")
+    return "".join(parts), [], False
+
+
+def run_sweep(
+    llm: Llama,
+    prompt_tokens: Sequence[int],
+    configs: Sequence[SweepConfig],
+    *,
+    max_tokens: int = 128,
+    stop: Optional[List[str]] = None,
+) -> SweepResult:
+    """Prefill ``prompt_tokens`` once and decode every config from it."""
+    tokens = list(prompt_tokens)
+    # Caching a state after every config would cost more than the sweep saves.
+    cache, llm.cache = llm.cache, None
+    try:
+        with tracing.span("sweep_prefill", tokens=len(tokens)):
+            start = time.perf_counter()
+            llm.reset()
+            tracing.begin_completion("text")
+            llm.eval(tokens)
+            snapshot = llm.save_state()
+            result = SweepResult(len(tokens), time.perf_counter() - start)
+
+        for config in configs:
+            # Decoding leaves the prompt in place unless a context shift moved it.
+            intact = llm.n_tokens >= len(tokens) and llm.input_ids[: len(tokens)].tolist() == tokens
+            if not intact:
+                llm.load_state(snapshot)
+            with tracing.span("sweep_config", **asdict(config)):
+                start = time.perf_counter()
+                tracing.begin_completion("text")
+                output = llm.create_completion(
+                    tokens,
+                    max_tokens=max_tokens,
+                    temperature=config.temperature,
+                    top_p=config.top_p,
+                    top_k=config.top_k,
+                    repeat_penalty=config.repeat_penalty,
+                    seed=config.seed,
+                    stop=stop or [],
+                )
+                elapsed = time.perf_counter() - start
+            choice = output["choices"][0]
+            result.rows.append(
+                SweepRow(
+                    config,
+                    choice.get("text", "").strip(),
+                    output.get("usage", {}).get("completion_tokens", 0),
+                    elapsed,
+                    choice.get("finish_reason"),
+                )
+            )
+        return result
+    finally:
+        llm.cache = cache
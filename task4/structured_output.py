@@ -0,0 +1,103 @@
+"""JSON-schema constrained replies backed by cached llama.cpp grammars.
+
+A schema is turned into a GBNF grammar once (``LlamaGrammar.from_json_schema``
+parses and compiles it, which is not free) and reused for every later reply
+with the same schema.  During decoding the grammar masks every token that would
+break the schema, so the model cannot ramble past the closing brace and the
+text always parses.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from llama_cpp import LlamaGrammar
+
+RECEPTIONIST_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        # null when the question is not about a product (returns, opening hours, ...)
+        "item": {"type": ["string", "null"]},
+        "price_min": {"type": ["number", "null"]},
+        "price_max": {"type": ["number", "null"]},
+        "in_stock": {"type": ["boolean", "null"]},
+        "alternatives": {"type": "array", "items": {"type": "string"}, "maxItems": 3},
+    },
+    "required": ["reply", "item", "price_min", "price_max", "in_stock", "alternatives"],
+}
+
+_GRAMMARS: Dict[str, "LlamaGrammar"] = {}
+_LOCK = threading.Lock()
+
+
+class StructuredReplyError(ValueError):
+    """The model output did not parse as the requested schema (e.g. cut off by max_tokens)."""
+
+    def __init__(self, message: str, text: str) -> None:
+        super().__init__(message)
+        self.text = text
+
+
+def schema_key(schema: Dict[str, Any]) -> str:
+    return json.dumps(schema, sort_keys=True, ensure_ascii=False)
+
+
+def grammar_for(schema: Dict[str, Any]) -> LlamaGrammar:
+    """Compiled grammar for ``schema``, built on first use and cached."""
+    key = schema_key(schema)
+    with _LOCK:
+        grammar = _GRAMMARS.get(key)
+        if grammar is None:
+            from llama_cpp import LlamaGrammar
+
+            grammar = LlamaGrammar.from_json_schema(key, verbose=False)
+            _GRAMMARS[key] = grammar
+        return grammar
+
+
+def clear_grammars() -> None:
+    with _LOCK:
+        _GRAMMARS.clear()
+
+
+def structured_prompt(user_input: str, schema: Dict[str, Any]) -> str:
+    """User message plus a short note naming the fields to fill in."""
+    fields = ", ".join(schema.get("properties", {}))
+    return (
+        f"{user_input}\n\nAnswer only with a JSON object with the fields: {fields}. "
+        "Keep \"reply\" to one or two sentences and use null for fields that do not apply."
+    )
+
+
+def parse_structured(text: str, schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as exc:
+        raise StructuredReplyError(f"Reply is not valid JSON ({exc}); raise max_tokens?", text) from exc
+    if not isinstance(data, dict):
+        raise StructuredReplyError("Reply is not a JSON object", text)
+    missing = [name for name in (schema or {}).get("required", []) if name not in data]
+    if missing:
+        raise StructuredReplyError(f"Reply is missing fields: {', '.join(missing)}", text)
+    return data
+
+
+def format_structured(data: Dict[str, Any]) -> str:
+    """Receptionist fields as a short human-readable block."""
+    lines = [str(data.get("reply", "")).strip()]
+    details = []
+    if data.get("item"):
+        details.append(f"item: {data['item']}")
+    if data.get("price_min") is not None and data.get("price_max") is not None:
+        details.append(f"price: ${data['price_min']:g}–${data['price_max']:g}")
+    if data.get("in_stock") is not None:
+        details.append("in stock" if data["in_stock"] else "out of stock")
+    if details:
+        lines.append("  [" + " | ".join(details) + "]")
+    if data.get("alternatives"):
+        lines.append("  alternatives: " + ", ".join(map(str, data["alternatives"])))
+    return "\n".join(line for line in lines if line)
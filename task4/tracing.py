@@ -0,0 +1,191 @@
+"""Opt-in per-phase timeline tracing, exported as Chrome trace / Perfetto JSON.
+
+Enable with ``tracing.enable()`` or by setting ``CHAT_TRACE=/path/trace.json``
+before starting the GUI or any backend script; the trace is then written on
+exit.  Open the file in ``chrome://tracing`` or https://ui.perfetto.dev.
+
+While disabled, ``span()`` hands back a shared no-op context manager, so the
+instrumented code pays one flag check per phase.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+_enabled = False
+_events: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+_pid = os.getpid()
+_named_threads: Dict[int, str] = {}
+_local = threading.local()
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000.0
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name: str, cat: str, args: Dict[str, Any]) -> None:
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        _record(self.name, self.cat, self.start, _now_us() - self.start, self.args)
+
+
+def _record(name: str, cat: str, start_us: float, dur_us: float, args: Optional[Dict[str, Any]] = None) -> None:
+    thread = threading.current_thread()
+    tid = thread.ident or 0
+    event = {"name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": dur_us, "pid": _pid, "tid": tid}
+    if args:
+        event["args"] = args
+    with _lock:
+        if tid not in _named_threads:
+            _named_threads[tid] = thread.name
+        _events.append(event)
+
+
+# ----------------------------------------------------------------------
+# Public API
+# ----------------------------------------------------------------------
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def clear() -> None:
+    with _lock:
+        _events.clear()
+
+
+def span(name: str, cat: str = "backend", **args: Any):
+    """Context manager timing one phase; nesting is inferred per thread."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def add_span(name: str, start_us: float, end_us: float, cat: str = "backend", **args: Any) -> None:
+    """Record a span whose boundaries were measured elsewhere (``now_us()`` units)."""
+    if _enabled:
+        _record(name, cat, start_us, end_us - start_us, args)
+
+
+def now_us() -> float:
+    return _now_us()
+
+
+def export_chrome_trace(path: str) -> int:
+    """Write all recorded spans to ``path``; returns the number of spans."""
+    with _lock:
+        events = list(_events)
+        threads = dict(_named_threads)
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": _pid, "tid": tid, "args": {"name": name}}
+        for tid, name in threads.items()
+    ]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+
+# ----------------------------------------------------------------------
+# llama.cpp instrumentation
+# ----------------------------------------------------------------------
+def begin_completion(kind: str) -> None:
+    """Mark the start of a completion call so the next eval counts as prefill.
+
+    For chat completions the time until the first tokenize call is recorded as
+    template rendering.
+    """
+    if not _enabled:
+        return
+    _local.evals = 0
+    _local.template_start = _now_us() if kind == "chat" else None
+
+
+def instrument_llama(llm: Any) -> None:
+    """Wrap ``tokenize``/``eval``/``sample``/``detokenize`` on one ``Llama`` instance."""
+
+    def wrap(method_name: str, phase: Callable[[tuple], str]) -> None:
+        original = getattr(llm, method_name)
+
+        def traced(*a: Any, **kw: Any) -> Any:
+            if not _enabled:
+                return original(*a, **kw)
+            name = phase(a)
+            start = _now_us()
+            try:
+                return original(*a, **kw)
+            finally:
+                end = _now_us()
+                args = {"tokens": len(a[0])} if name in {"prefill", "decode"} and a else None
+                _record(name, "llama", start, end - start, args)
+
+        setattr(llm, method_name, traced)
+
+    def tokenize_phase(a: tuple) -> str:
+        start = getattr(_local, "template_start", None)
+        if start is not None:
+            _local.template_start = None
+            _record("chat_template", "llama", start, _now_us() - start)
+        return "tokenize"
+
+    def eval_phase(a: tuple) -> str:
+        evals = getattr(_local, "evals", 0)
+        _local.evals = evals + 1
+        return "prefill" if evals == 0 else "decode"
+
+    wrap("tokenize", tokenize_phase)
+    wrap("eval", eval_phase)
+    wrap("sample", lambda a: "sample")
+    wrap("detokenize", lambda a: "detokenize")
+
+
+def _export_on_exit(path: str) -> None:
+    count = export_chrome_trace(path)
+    print(f"[tracing] wrote {count} spans to {path}")
+
+
+_env_path = os.environ.get("CHAT_TRACE")
+if _env_path:
+    enable()
+    atexit.register(_export_on_exit, _env_path)
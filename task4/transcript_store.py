@@ -0,0 +1,390 @@
+"""Background transcript and metrics logging into an indexed SQLite store.
+
+Front ends call ``log_turn`` from their generation thread; the call only puts a
+record on an in-memory queue.  A writer thread drains the queue and commits in
+batches (every ``batch_size`` records or ``flush_interval`` seconds), so
+generation never waits on disk.  Sessions and turns are indexed by session,
+model and time for latency analysis across many past runs.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+DEFAULT_DB = "runs/transcripts.sqlite3"
+
+
+def model_key(model_path: str) -> str:
+    """The ``model`` value every front end logs: the GGUF file name.
+
+    Using one identifier keeps a model's turns under one key no matter which
+    front end (or which display label) produced them.
+    """
+    return os.path.basename(model_path)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    frontend TEXT NOT NULL,
+    model TEXT,
+    system_prompt TEXT,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    turn_index INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    model TEXT,
+    user TEXT,
+    assistant TEXT,
+    latency REAL,
+    ttft REAL,
+    tokens INTEGER,
+    rss_mb REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_model ON sessions(model, started_at);
+CREATE INDEX IF NOT EXISTS idx_turns_session ON turns(session_id, turn_index);
+CREATE INDEX IF NOT EXISTS idx_turns_model_ts ON turns(model, ts);
+CREATE INDEX IF NOT EXISTS idx_turns_ts ON turns(ts);
+"""
+
+_TURN_COLUMNS = ("session_id", "turn_index", "ts", "model", "user", "assistant", "latency", "ttft", "tokens", "rss_mb", "extra")
+
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+class TranscriptStore:
+    """Non-blocking writer plus read helpers over one SQLite database."""
+
+    def __init__(self, path: str = DEFAULT_DB, *, batch_size: int = 64, flush_interval: float = 1.0) -> None:
+        self.path = path
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._turn_counters: Dict[str, int] = {}
+        self._counter_lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self) -> None:
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        pending: List[Any] = []
+        waiters: List[threading.Event] = []
+        stop = False
+        while not stop:
+            deadline = time.monotonic() + self.flush_interval
+            while len(pending) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                pending.append(item)
+            if pending:
+                try:
+                    self._write_batch(conn, pending)
+                except sqlite3.Error as exc:  # pragma: no cover - never take the app down for logging
+                    print(f"[TranscriptStore] Failed to write {len(pending)} records: {exc}")
+                pending = []
+            for event in waiters:
+                event.set()
+            waiters = []
+        conn.close()
+
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, items: List[Any]) -> None:
+        with conn:
+            for kind, payload in items:
+                if kind == "session":
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sessions (id, frontend, model, system_prompt, started_at, meta)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        payload,
+                    )
+                elif kind == "end":
+                    conn.execute("UPDATE sessions SET ended_at = ? WHERE id = ?", payload)
+                elif kind == "turn":
+                    conn.execute(
+                        f"INSERT INTO turns ({', '.join(_TURN_COLUMNS)}) VALUES ({', '.join('?' * len(_TURN_COLUMNS))})",
+                        payload,
+                    )
+
+    # ------------------------------------------------------------------
+    # Logging API (never blocks on I/O)
+    # ------------------------------------------------------------------
+    def start_session(
+        self,
+        frontend: str,
+        model: Optional[str] = None,
+        *,
+        system_prompt: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        session_id = uuid.uuid4().hex
+        with self._counter_lock:
+            self._turn_counters[session_id] = 0
+        meta_json = json.dumps(meta, ensure_ascii=False) if meta else None
+        self._queue.put(("session", (session_id, frontend, model, system_prompt, time.time(), meta_json)))
+        return session_id
+
+    def end_session(self, session_id: str) -> None:
+        with self._counter_lock:
+            self._turn_counters.pop(session_id, None)
+        self._queue.put(("end", (time.time(), session_id)))
+
+    def log_turn(
+        self,
+        session_id: str,
+        user: str,
+        assistant: str,
+        *,
+        model: Optional[str] = None,
+        latency: Optional[float] = None,
+        ttft: Optional[float] = None,
+        tokens: Optional[int] = None,
+        rss_mb: Optional[float] = None,
+        **extra: Any,
+    ) -> None:
+        with self._counter_lock:
+            turn_index = self._turn_counters.get(session_id, 0)
+            self._turn_counters[session_id] = turn_index + 1
+        extra_json = json.dumps(extra, ensure_ascii=False, default=str) if extra else None
+        self._queue.put(
+            ("turn", (session_id, turn_index, time.time(), model, user, assistant, latency, ttft, tokens, rss_mb, extra_json))
+        )
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Wait until everything logged so far is committed."""
+        if self._closed:
+            return True
+        event = threading.Event()
+        self._queue.put(event)
+        return event.wait(timeout)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+
+    # ------------------------------------------------------------------
+    # Queries (separate read connection; WAL keeps them off the writer's path)
+    # ------------------------------------------------------------------
+    def _read(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        except sqlite3.OperationalError:
+            # Schema not created yet by the writer thread.
+            return []
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _filters(
+        session_id: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        prefix: str = "",
+        time_column: str = "ts",
+    ):
+        clauses, params = [], []
+        if session_id:
+            clauses.append(f"{prefix}session_id = ?")
+            params.append(session_id)
+        if model:
+            clauses.append(f"{prefix}model = ?")
+            params.append(model)
+        if since is not None:
+            clauses.append(f"{prefix}{time_column} >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{prefix}{time_column} < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, tuple(params)
+
+    def sessions(
+        self,
+        *,
+        frontend: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        where, params = self._filters(model=model, since=since, prefix="s.", time_column="started_at")
+        if frontend:
+            where += (" AND" if where else " WHERE") + " s.frontend = ?"
+            params += (frontend,)
+        return self._read(
+            "SELECT s.*, COUNT(t.id) AS turns, AVG(t.latency) AS avg_latency FROM sessions s"
+            f" LEFT JOIN turns t ON t.session_id = s.id{where}"
+            " GROUP BY s.id ORDER BY s.started_at DESC LIMIT ?",
+            params + (limit,),
+        )
+
+    def turns(
+        self,
+        *,
+        session_id: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        where, params = self._filters(session_id, model, since, until)
+        sql = f"SELECT * FROM turns{where} ORDER BY ts"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return self._read(sql, params)
+
+    def latency_stats(
+        self,
+        *,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Per-model turn count and latency/TTFT percentiles."""
+        where, params = self._filters(model=model, since=since, until=until)
+        rows = self._read(f"SELECT model, latency, ttft FROM turns{where} ORDER BY model", params)
+        grouped: Dict[Optional[str], Dict[str, List[float]]] = {}
+        for row in rows:
+            bucket = grouped.setdefault(row["model"], {"latency": [], "ttft": []})
+            if row["latency"] is not None:
+                bucket["latency"].append(row["latency"])
+            if row["ttft"] is not None:
+                bucket["ttft"].append(row["ttft"])
+        stats = []
+        for name, values in grouped.items():
+            latency = sorted(values["latency"])
+            ttft = sorted(values["ttft"])
+            stats.append(
+                {
+                    "model": name,
+                    "turns": len(latency),
+                    "latency_p50": _percentile(latency, 50),
+                    "latency_p95": _percentile(latency, 95),
+                    "ttft_p50": _percentile(ttft, 50),
+                    "ttft_p95": _percentile(ttft, 95),
+                }
+            )
+        return stats
+
+    def export_text(self, session_id: str, path: str) -> int:
+        """Write one session as a plain-text transcript; returns the turn count."""
+        self.flush()
+        rows = self.turns(session_id=session_id)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                latency = row["latency"] or 0.0
+                rss = row["rss_mb"] or 0.0
+                f.write(f"USER: {row['user']}\nASSISTANT: {row['assistant']}\n-- {latency:.2f}s, {rss:.1f}MB --\n\n")
+        return len(rows)
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time: {value}")
+
+
+def main() -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Query the transcript store.")
+    ap.add_argument("--db", type=str, default=DEFAULT_DB)
+    sub = ap.add_subparsers(dest="command", required=True)
+    for name in ("sessions", "stats"):
+        p = sub.add_parser(name)
+        p.add_argument("--model", type=str, default=None)
+        p.add_argument("--since", type=str, default=None, help="YYYY-MM-DD[ HH:MM[:SS]]")
+        p.add_argument("--until", type=str, default=None)
+        p.add_argument("--frontend", type=str, default=None)
+        p.add_argument("--limit", type=int, default=50)
+    show = sub.add_parser("show")
+    show.add_argument("session_id")
+    args = ap.parse_args()
+
+    store = TranscriptStore(args.db)
+    try:
+        if args.command == "sessions":
+            for row in store.sessions(frontend=args.frontend, model=args.model, since=_parse_time(args.since), limit=args.limit):
+                started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["started_at"]))
+                avg = f"{row['avg_latency']:.2f}s" if row["avg_latency"] is not None else "-"
+                print(f"{row['id']}  {started}  {row['frontend']:<8} {row['model'] or '-':<28} {row['turns']:>4} turns  avg {avg}")
+        elif args.command == "stats":
+            print(f"{'model':<30} {'turns':>6} {'lat p50':>8} {'lat p95':>8} {'ttft p50':>9} {'ttft p95':>9}")
+            fmt = lambda v: f"{v:.2f}" if v is not None else "-"
+            for row in store.latency_stats(model=args.model, since=_parse_time(args.since), until=_parse_time(args.until)):
+                print(
+                    f"{row['model'] or '-':<30} {row['turns']:>6} {fmt(row['latency_p50']):>8} {fmt(row['latency_p95']):>8}"
+                    f" {fmt(row['ttft_p50']):>9} {fmt(row['ttft_p95']):>9}"
+                )
+        elif args.command == "show":
+            for row in store.turns(session_id=args.session_id):
+                print(f"USER: {row['user']}\nASSISTANT: {row['assistant']}\n-- {row['latency'] or 0:.2f}s --\n")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""JSONL imports into the task3 dataset cache."""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "task3"))
+from dataset_cache import DatasetCache  # noqa: E402
+
+
+def _write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def test_jsonl_schema_is_unified_across_batches(tmp_path):
+    rows = [{"a": i, "b": None} for i in range(4)]
+    rows += [{"a": 2.5, "b": "x"}, {"a": 7, "b": "y", "c": True}]
+    source = tmp_path / "mixed.jsonl"
+    _write_jsonl(source, rows)
+
+    cache = DatasetCache(str(tmp_path / "cache"))
+    manifest = cache.import_dataset("mixed", str(source), batch_size=2)
+    assert manifest["num_rows"] == len(rows)
+    assert manifest["columns"] == ["a", "b", "c"]
+
+    with cache.open("mixed") as ds:
+        assert ds.schema.field("a").type == pa.float64()
+        assert ds.schema.field("b").type == pa.string()
+        got = list(ds.iter_rows())
+    assert [r["a"] for r in got] == [0, 1, 2, 3, 2.5, 7]
+    assert [r["b"] for r in got] == [None] * 4 + ["x", "y"]
+    assert [r["c"] for r in got] == [None] * 5 + [True]
+
+
+def test_failed_import_leaves_no_tmp_file(tmp_path):
+    source = tmp_path / "bad.jsonl"
+    source.write_text('{"a": 1}\n{"a": \n', encoding="utf-8")
+    cache = DatasetCache(str(tmp_path / "cache"))
+    with pytest.raises(ValueError):
+        cache.import_dataset("bad", str(source), batch_size=1)
+    assert not cache.has("bad")
+    assert not [name for name in os.listdir(tmp_path / "cache") if name.endswith(".tmp")]
@@ -0,0 +1,49 @@
+"""Import-time budget for the task4 entry points.
+
+Importing the backend or asking the GUI for ``--help`` / ``--list-models``
+must not pull in llama_cpp, numpy or psutil; those are only imported once a
+model is actually loaded.
+"""
+
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+TASK4 = Path(__file__).resolve().parent.parent / "task4"
+HEAVY = ("llama_cpp", "numpy", "psutil")
+BUDGET_S = 1.5
+
+
+def _run_importtime(*args):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=TASK4,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    elapsed = time.perf_counter() - start
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    modules = set(re.findall(r"^import time:\s+\d+\s+\|\s+\d+\s+\|\s+(\S+)", proc.stderr, re.MULTILINE))
+    return modules, elapsed
+
+
+def _assert_light(modules, elapsed):
+    heavy = sorted(m for m in modules if m.split(".")[0] in HEAVY)
+    assert not heavy, f"heavy modules imported eagerly: {heavy}"
+    assert elapsed < BUDGET_S, f"took {elapsed:.2f}s (budget {BUDGET_S}s)"
+
+
+def test_import_chat_backend_is_light():
+    _assert_light(*_run_importtime("-c", "import chat_backend"))
+
+
+@pytest.mark.parametrize("flag", ["--help", "--list-models"])
+def test_chat_gui_cli_is_light(flag):
+    pytest.importorskip("tkinter")
+    _assert_light(*_run_importtime("chat_gui.py", flag))